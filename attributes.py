@@ -0,0 +1,109 @@
+import time
+import threading
+from collections import Counter, deque
+import numpy as np
+import config
+
+ACTIONS = ("age", "gender", "emotion")
+
+
+class AttributeCache:
+    """Age, gender and emotion per face_id, so the attribute models skip faces already known.
+
+    Age is the mean and gender the majority vote of the last `window`
+    estimates. Once an identity has `min_samples` of them they are served
+    from the cache, and only recomputed (and folded into the window) every
+    `ttl` seconds. Emotion changes quickly, so it is recomputed every
+    `emotion_refresh` seconds instead. Shared by every stream, since face_ids
+    are; ttl=0 turns the cache off.
+    """
+
+    def __init__(self, ttl=None, emotion_refresh=None, min_samples=None, window=None, threshold=0.6):
+        self.ttl = config.ATTRIBUTE_TTL if ttl is None else ttl
+        self.emotion_refresh = config.EMOTION_REFRESH if emotion_refresh is None else emotion_refresh
+        self.min_samples = min_samples or config.ATTRIBUTE_MIN_SAMPLES
+        self.window = window or config.ATTRIBUTE_WINDOW
+        self.threshold = threshold      # same distance get_face_id matches identities at
+        self.counts = Counter()         # (attribute, "cached" | "computed") -> faces
+        self._entries = {}              # face_id -> entry dict
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def _needs(self, entry, now):
+        if entry is None:
+            return ACTIONS
+        stale = len(entry["ages"]) < self.min_samples or now - entry["updated"] >= self.ttl
+        acts = ("age", "gender") if stale else ()
+        if now - entry["emotion_at"] >= self.emotion_refresh:
+            acts += ("emotion",)
+        return acts
+
+    def hints(self, cache, now):
+        """What inference still has to compute for the identities in a StreamCache.
+
+        Returns {"vecs", "actions", "threshold"} for inference.analyze_batch:
+        a face whose embedding is within threshold of vecs[i] only runs
+        actions[i]. None when the cache is off or knows none of them.
+        """
+        if not self.ttl or cache.vecs is None:
+            return None
+        rows, acts = [], []
+        with self._lock:
+            for i, fid in enumerate(cache.ids):
+                if fid is None or cache.last_seen[i] == -np.inf:
+                    continue
+                entry = self._entries.get(fid)
+                if entry is not None:
+                    rows.append(i)
+                    acts.append(self._needs(entry, now))
+        if not rows:
+            return None
+        return {"vecs": cache.vecs[rows].copy(), "actions": acts, "threshold": self.threshold}
+
+    def update(self, face, now):
+        """Fold a face's freshly computed attributes in and fill the rest from the cache."""
+        if not self.ttl:
+            return face
+        fid = face["face_id"]
+        with self._lock:
+            entry = self._entries.get(fid)
+            if entry is None:
+                entry = self._entries[fid] = {"ages": deque(maxlen=self.window),
+                                              "genders": deque(maxlen=self.window),
+                                              "emotion": None, "emotion_at": -np.inf, "updated": now}
+            if face["age"] is not None or face["gender"] is not None:
+                if face["age"] is not None:
+                    entry["ages"].append(float(face["age"]))
+                if face["gender"] is not None:
+                    entry["genders"].append(face["gender"])
+                entry["updated"] = now
+                self.counts["age_gender", "computed"] += 1
+            else:
+                self.counts["age_gender", "cached"] += 1
+            if face["emotion"] is not None:
+                entry["emotion"], entry["emotion_at"] = face["emotion"], now
+                self.counts["emotion", "computed"] += 1
+            else:
+                self.counts["emotion", "cached"] += 1
+            if entry["ages"]:
+                face["age"] = round(sum(entry["ages"]) / len(entry["ages"]))
+            if entry["genders"]:
+                face["gender"] = Counter(entry["genders"]).most_common(1)[0][0]
+            face["emotion"] = entry["emotion"]
+            if time.monotonic() - self._swept_at > self.ttl:
+                self._sweep(now)
+        return face
+
+    def _sweep(self, now):
+        """Drop identities not seen for a few TTLs (left, evicted or merged away)."""
+        self._swept_at = time.monotonic()
+        for fid in [f for f, e in self._entries.items() if now - max(e["updated"], e["emotion_at"]) > 4 * self.ttl]:
+            del self._entries[fid]
+
+    def stats(self):
+        with self._lock:
+            return {"identities": len(self._entries),
+                    **{f"{attr}_{result}": n for (attr, result), n in sorted(self.counts.items())}}
+
+
+attribute_cache = AttributeCache()
@@ -0,0 +1,323 @@
+"""Offline analysis of recorded video files, as fast as decode and inference allow.
+
+A job covers one file or every video under a directory. Each file is split
+into chunks of BATCH_CHUNK_FRAMES frames that are decoded in parallel
+(OpenCV releases the GIL while decoding), sampled frames go through the
+shared inference scheduler in a bounded window, and faces are resolved with
+the same get_face_id logic as live streams, in frame order.
+
+Results are kept as rows while the job runs (streamed by
+GET /jobs/{id}/results) and written at the end as one columnar .npz file,
+one entry per detected face:
+
+    source (int16, index into files), frame (int32), timestamp_ms (int64),
+    face (int32, N of person_N), age (int16, -1 = unknown),
+    gender / emotion (int8, index into genders / emotions, -1 = unknown),
+    box (int16 x, y, w, h), embedding (float16, only with "embeddings": true)
+"""
+import os
+import time
+import uuid
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+import config
+from scheduler import get_scheduler
+from face_registry import get_face_id, stream_cache, drop_stream
+from registry_store import face_number
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".webm", ".m4v", ".mpg", ".mpeg", ".ts")
+ANALYSIS_SIZE = (640, 480)
+COLUMNS = ("source", "frame", "timestamp_ms", "face", "age", "gender", "emotion", "x", "y", "w", "h")
+
+
+def video_files(path):
+    """The file itself, or every video under a directory in a stable order."""
+    if os.path.isfile(path):
+        return [path]
+    found = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        found.extend(os.path.join(root, f) for f in sorted(files)
+                     if f.lower().endswith(VIDEO_EXTENSIONS))
+    return found
+
+
+def probe(path):
+    """(frame_count, fps) of a video; frame_count is 0 when the container doesn't say."""
+    import cv2      # not at module level: the server only needs cv2 once something is decoded
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"cannot open video: {path}")
+        return max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0), cap.get(cv2.CAP_PROP_FPS) or 25.0
+    finally:
+        cap.release()
+
+
+def decode_chunk(path, start, stop, step, size=ANALYSIS_SIZE, cancel=None):
+    """Decode frames [start, stop) of path (stop=None: to the end), keeping every step-th.
+
+    Skipped frames are only grabbed, never converted. Returns [(index, frame)];
+    stops early once the cancel event is set.
+    """
+    import cv2
+    cap = cv2.VideoCapture(path)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    out, raw, i = [], None, start
+    try:
+        while (stop is None or i < stop) and not (cancel and cancel.is_set()):
+            if not cap.grab():
+                break
+            if i % step == 0:
+                ok, raw = cap.retrieve(raw)
+                if not ok:
+                    break
+                if (raw.shape[1], raw.shape[0]) != size:
+                    frame = cv2.resize(raw, size, interpolation=cv2.INTER_AREA)
+                else:
+                    frame = raw.copy()
+                out.append((i, frame))
+            i += 1
+    finally:
+        cap.release()
+    return out
+
+
+def output_path(name, job_id):
+    """Where a job writes its .npz: a bare file name, which must stay inside BATCH_OUTPUT_DIR."""
+    out_dir = os.path.realpath(config.BATCH_OUTPUT_DIR)
+    if not name:
+        return os.path.join(out_dir, f"{job_id}.npz")
+    if not isinstance(name, str) or os.path.basename(name) != name or name in (".", ".."):
+        raise ValueError(f"output must be a bare file name, got {name!r}")
+    path = os.path.realpath(os.path.join(out_dir, name))
+    if os.path.dirname(path) != out_dir:
+        raise ValueError(f"output is outside BATCH_OUTPUT_DIR: {name}")
+    return path
+
+
+def inside(path, root):
+    """Whether path resolves (symlinks included) to root or somewhere below it."""
+    path, root = os.path.realpath(path), os.path.realpath(root)
+    return os.path.commonpath([path, root]) == root
+
+
+class Job:
+    def __init__(self, path, options=None):
+        options = options or {}
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        sample_fps = options.get("sample_fps", config.BATCH_SAMPLE_FPS)
+        if isinstance(sample_fps, bool) or not isinstance(sample_fps, (int, float)) or sample_fps < 0:
+            raise ValueError(f"sample_fps must be a number >= 0, got {sample_fps!r}")
+        self.sample_fps = float(sample_fps)
+        self.embeddings = bool(options.get("embeddings", False))
+        self.output = output_path(options.get("output"), self.id)
+        self.files = video_files(path)
+        self.status = "queued"
+        self.error = None
+        self.created = datetime.utcnow().isoformat()
+        self.started = self.finished = None
+        self.files_done = 0
+        self.frames_decoded = 0
+        self.frames_analyzed = 0
+        self.rows = []          # tuples in COLUMNS order
+        self.vectors = []       # float16 embeddings aligned with rows, if requested
+        self._labels = {"gender": {}, "emotion": {}}
+        self._cancel = threading.Event()
+        self._t0 = None
+
+    def _code(self, kind, value):
+        if value is None:
+            return -1
+        table = self._labels[kind]
+        return table.setdefault(value, len(table))
+
+    def cancel(self):
+        self._cancel.set()
+
+    def done(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def results(self, start=0):
+        """Rows from index start on, as dicts shaped like the live analysis results."""
+        genders = {v: k for k, v in self._labels["gender"].items()}
+        emotions = {v: k for k, v in self._labels["emotion"].items()}
+        return [{"file": self.files[f], "frame": frame, "timestamp_ms": ts,
+                 "face_id": f"person_{face}", "age": None if age < 0 else age,
+                 "gender": genders.get(g), "emotion": emotions.get(e),
+                 "region": {"x": x, "y": y, "w": w, "h": h}}
+                for f, frame, ts, face, age, g, e, x, y, w, h in self.rows[start:]]
+
+    def stats(self):
+        elapsed = ((self.finished or time.time()) - self._t0) if self._t0 else 0.0
+        return {
+            "id": self.id, "status": self.status, "path": self.path, "error": self.error,
+            "files": len(self.files), "files_done": self.files_done,
+            "frames_decoded": self.frames_decoded, "frames_analyzed": self.frames_analyzed,
+            "faces": len(self.rows), "identities": len({r[3] for r in self.rows}),
+            "elapsed": elapsed, "frames_per_second": self.frames_analyzed / elapsed if elapsed else 0.0,
+            "output": self.output if self.status == "done" else None,
+            "created": self.created, "started": self.started,
+        }
+
+    def run(self):
+        self.status = "running"
+        self.started = datetime.utcnow().isoformat()
+        self._t0 = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=config.BATCH_DECODE_WORKERS,
+                                    thread_name_prefix=f"decode-{self.id}") as decoders:
+                for index, path in enumerate(self.files):
+                    if self._cancel.is_set():
+                        break
+                    self._run_file(index, path, decoders)
+                    self.files_done += 1
+            if self._cancel.is_set():
+                self.status = "cancelled"
+            else:
+                self._write()
+                self.status = "done"
+        except Exception as e:
+            self.error = repr(e)
+            self.status = "failed"
+        finally:
+            self.finished = time.time()
+
+    def _run_file(self, index, path, decoders):
+        count, fps = probe(path)
+        step = max(1, round(fps / self.sample_fps)) if self.sample_fps > 0 else 1
+        # Decoded frames waiting for inference are bounded by BATCH_READAHEAD_FRAMES, not the core
+        # count: chunks small enough that two fit, and as many decoding ahead as the budget allows
+        budget = max(2, config.BATCH_READAHEAD_FRAMES)
+        size = max(1, min(config.BATCH_CHUNK_FRAMES, budget // 2 * step))
+        per_chunk = -(-size // step)
+        ahead = max(1, min(2 * config.BATCH_DECODE_WORKERS, budget // per_chunk - 1))
+        # Without a reliable frame count the file is decoded as one sequential chunk
+        bounds = [(s, min(s + size, count)) for s in range(0, count, size)] if count else [(0, None)]
+        chunks = deque()
+        pending = iter(bounds)
+        for start, stop in pending:
+            chunks.append(decoders.submit(decode_chunk, path, start, stop, step,
+                                          cancel=self._cancel))
+            if len(chunks) >= ahead:
+                break
+
+        key = f"job-{self.id}/{index}"
+        cache = stream_cache(key)
+        scheduler = get_scheduler()
+        window = deque()        # (frame index, inference future), in frame order
+        try:
+            while chunks and not self._cancel.is_set():
+                frames = chunks.popleft().result()
+                nxt = next(pending, None)
+                if nxt is not None:
+                    chunks.append(decoders.submit(decode_chunk, path, *nxt, step, cancel=self._cancel))
+                self.frames_decoded += len(frames)
+                for i, frame in frames:
+                    fut = scheduler.submit(key, frame, block=True)
+                    window.append((i, fut))
+                    if len(window) >= config.BATCH_IN_FLIGHT:
+                        self._collect(index, fps, window.popleft(), key, cache)
+            while window:
+                self._collect(index, fps, window.popleft(), key, cache)
+        finally:
+            for chunk in chunks:
+                chunk.cancel()
+            drop_stream(key)
+
+    def _collect(self, file_index, fps, item, key, cache):
+        i, fut = item
+        faces = fut.result()
+        self.frames_analyzed += 1
+        for face in faces:
+            fid = get_face_id(face["embedding"], key, cache=cache)
+            r = face["region"]
+            self.rows.append((file_index, i, int(i * 1000 / fps), face_number(fid),
+                              int(face["age"]) if face["age"] else -1,
+                              self._code("gender", face["gender"]), self._code("emotion", face["emotion"]),
+                              r["x"], r["y"], r["w"], r["h"]))
+            if self.embeddings:
+                self.vectors.append(np.asarray(face["embedding"], dtype=np.float16))
+
+    def _write(self):
+        rows = np.array(self.rows, dtype=np.int64).reshape(-1, len(COLUMNS))
+        col = dict(zip(COLUMNS, rows.T))
+        out = {
+            "source": col["source"].astype(np.int16), "frame": col["frame"].astype(np.int32),
+            "timestamp_ms": col["timestamp_ms"], "face": col["face"].astype(np.int32),
+            "age": col["age"].astype(np.int16),
+            "gender": col["gender"].astype(np.int8), "emotion": col["emotion"].astype(np.int8),
+            "box": np.stack([col[k] for k in ("x", "y", "w", "h")], axis=1).astype(np.int16),
+            "files": np.array(self.files), "genders": np.array(list(self._labels["gender"])),
+            "emotions": np.array(list(self._labels["emotion"])),
+        }
+        if self.embeddings and self.vectors:
+            out["embedding"] = np.stack(self.vectors)
+        os.makedirs(os.path.dirname(self.output), exist_ok=True)
+        tmp = self.output + ".tmp.npz"
+        np.savez_compressed(tmp, **out)
+        os.replace(tmp, self.output)
+
+
+class JobManager:
+    """Runs submitted jobs in order, BATCH_CONCURRENCY at a time."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def submit(self, path, options=None):
+        root = config.BATCH_ROOT
+        if root and not inside(path, root):
+            raise ValueError(f"path is outside BATCH_ROOT: {path}")
+        if not os.path.exists(path):
+            raise ValueError(f"no such file or directory: {path}")
+        job = Job(path, options)
+        if root:
+            # Symlinked files under a directory may point anywhere
+            job.files = [f for f in job.files if inside(f, root)]
+        if not job.files:
+            raise ValueError(f"no video files under {path}")
+        with self._lock:
+            self._jobs[job.id] = job
+            if not self._workers:
+                for n in range(config.BATCH_CONCURRENCY):
+                    t = threading.Thread(target=self._run, name=f"batch-{n}", daemon=True)
+                    t.start()
+                    self._workers.append(t)
+        self._queue.put(job)
+        return job
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job.status == "queued":
+                job.run()
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job.cancel()
+        if job.status == "queued":
+            job.status = "cancelled"
+        return job
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.stats() for job in jobs]
+
+
+jobs = JobManager()
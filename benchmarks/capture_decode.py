@@ -0,0 +1,93 @@
+"""Decode CPU per stream: read() every frame vs grab() + retrieve() only the analysed ones.
+
+"read" is the old capture path: every frame is decoded and converted, and
+the analysed ones are then resized into a fresh array. "grab" is what
+capture.FrameReader does: every frame is grabbed, only the analysed ones are
+retrieved into a reused buffer and resized into another.
+
+Run from the repo root:  python -m benchmarks.capture_decode [--video PATH]
+Without --video a synthetic 1080p clip is written to a temp dir first.
+"""
+import argparse
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+
+SIZE = (640, 480)
+
+
+def synthetic_clip(path, seconds, fps, size=(1920, 1080)):
+    w, h = size
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    yy, xx = np.mgrid[0:h, 0:w]
+    for i in range(int(seconds * fps)):
+        frame = np.empty((h, w, 3), dtype=np.uint8)
+        frame[..., 0] = (xx + 8 * i) & 255
+        frame[..., 1] = (yy + 4 * i) & 255
+        frame[..., 2] = ((xx ^ yy) + i) & 255
+        cv2.circle(frame, (int(w / 2 + w / 3 * np.sin(i / 10)), h // 2), 120, (255, 255, 255), -1)
+        out.write(frame)
+    out.release()
+
+
+def decode_read(path, every):
+    cap = cv2.VideoCapture(path)
+    n = 0
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if n % every == 0:
+            cv2.resize(frame, SIZE)
+        n += 1
+    cap.release()
+    return n
+
+
+def decode_grab(path, every):
+    cap = cv2.VideoCapture(path)
+    raw = out = None
+    n = 0
+    while cap.grab():
+        if n % every == 0:
+            ok, raw = cap.retrieve(raw)
+            out = cv2.resize(raw, SIZE, dst=out, interpolation=cv2.INTER_AREA)
+        n += 1
+    cap.release()
+    return n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--video")
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--analysis-fps", type=float, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.video
+        if path is None:
+            path = os.path.join(tmp, "clip.mp4")
+            synthetic_clip(path, args.seconds, 25)
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25
+        w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+        every = max(1, round(fps / args.analysis_fps))
+
+        print(f"{w}x{h} @ {fps:g} fps, analysing every {every}th frame")
+        print(f"{'path':>6} {'frames':>7} {'cpu s':>7} {'cpu ms / video s':>17}")
+        results = {}
+        for name, fn in (("read", decode_read), ("grab", decode_grab)):
+            start = time.process_time()
+            n = fn(path, every)
+            cpu = time.process_time() - start
+            results[name] = cpu
+            print(f"{name:>6} {n:>7} {cpu:>7.2f} {cpu / (n / fps) * 1e3:>17.1f}")
+        print(f"grab path uses {results['grab'] / results['read']:.0%} of the read path's CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""End-to-end throughput, result latency and memory with N concurrent streams.
+
+Starts the FastAPI app in this process (uvicorn on a free local port), opens
+one /ws/deepface connection per stream and plays a local video file on each
+until it ends. By default every stream gets its own generated clip of moving
+coloured squares and the model is stub_model (INFERENCE_BACKEND=stub), so the
+numbers are the pipeline's own overhead: decode, gating, scheduling,
+registry, serialisation and delivery. --model deepface runs the real models
+(use --video with real faces then); --stub-ms simulates model time.
+
+Reported:
+  frames/s      analysis results received per second, all streams together
+  latency       frame grabbed on the server -> its result received by the client
+  memory        RSS of this process and its inference workers: at start-up,
+                peak while streaming, and (peak - start-up) per stream
+  stages        mean per-stage seconds from the server's own metrics
+
+Run from the repo root:
+    python -m benchmarks.e2e --streams 1 4 8 [--seconds 10] [--json out.json]
+    python -m benchmarks.e2e --streams 4 --compare out.json      # deltas against an earlier run
+    python -m benchmarks.e2e --size 1920x1080 --options '{"two_stage": true, "detect_scale": 0.5}'
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+
+COLOURS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255), (0, 255, 255),
+           (255, 128, 0), (128, 0, 255)]
+SQUARE = 56
+
+
+def synthetic_clip(path, seconds, fps, faces, seed, size=(640, 480)):
+    """A clip of `faces` solid squares in distinct colours moving over a dim, noisy background.
+
+    Each square keeps to its own horizontal band, so squares never touch and
+    stub_model sees the same `faces` identities in every frame.
+    """
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    w, h = size
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    background = rng.integers(20, 120, (h, w, 3), dtype=np.uint8)
+    starts = rng.uniform(0, 2 * np.pi, faces)
+    band = h // faces
+    for i in range(int(seconds * fps)):
+        frame = background.copy()
+        for k in range(faces):
+            a = starts[k] + i / fps
+            x = int((w - SQUARE) * (0.5 + 0.5 * np.sin(a)))
+            y = k * band + int((band - SQUARE) * (0.5 + 0.5 * np.cos(1.3 * a)))
+            cv2.rectangle(frame, (x, y), (x + SQUARE - 1, y + SQUARE - 1),
+                          COLOURS[(seed + k) % len(COLOURS)], -1)
+        out.write(frame)
+    out.release()
+
+
+def rss_mb(pid=None):
+    """Resident memory of a process and all of its descendants (Linux /proc), in MB."""
+    pid = pid or os.getpid()
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    total, todo = 0, [pid]
+    while todo:
+        p = todo.pop()
+        todo.extend(children.get(p, []))
+        try:
+            with open(f"/proc/{p}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            pass
+    return total / 2 ** 20
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def start_server():
+    import uvicorn
+    import server
+    srv = uvicorn.Server(uvicorn.Config(server.app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=srv.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not srv.started:
+        if not thread.is_alive():
+            sys.exit("server failed to start")
+        time.sleep(0.05)
+    return srv, thread, srv.servers[0].sockets[0].getsockname()[1]
+
+
+async def play(port, stream_id, path, args, latencies, counts):
+    """One connection, one stream: collect result latencies until the file ends."""
+    import websockets
+    from wire import MsgpackDecoder
+    decoder = MsgpackDecoder()
+    options = {"id": stream_id, "url": path, "realtime": not args.fast, **args.options}
+    if args.max_fps:
+        options["max_fps"] = args.max_fps
+    async with websockets.connect(f"ws://127.0.0.1:{port}/ws/deepface", max_size=None) as ws:
+        await ws.send(json.dumps({"streams": [options], "format": args.format}))
+        async for message in ws:
+            now = time.time()
+            if isinstance(message, bytes):
+                payloads = decoder.decode(message)
+            else:
+                payloads = json.loads(message)
+                payloads = payloads if isinstance(payloads, list) else [payloads]
+            for payload in payloads:
+                kind = payload.get("type")
+                if kind == "analysis" and not payload.get("reused"):
+                    grabbed = payload["frame_timestamp"]   # epoch ms in msgpack, ISO string in json
+                    if isinstance(grabbed, str):
+                        grabbed = datetime.fromisoformat(grabbed).replace(tzinfo=timezone.utc).timestamp() * 1000
+                    latencies.append(now - grabbed / 1000)
+                    counts[stream_id] = counts.get(stream_id, 0) + 1
+                elif kind == "status" and payload.get("status") in ("stopped", "error"):
+                    return payload
+
+
+async def run_streams(port, paths, args):
+    latencies, counts, peak = [], {}, [rss_mb()]
+
+    async def sample():
+        while True:
+            peak.append(rss_mb())
+            await asyncio.sleep(0.25)
+
+    sampler = asyncio.create_task(sample())
+    start = time.perf_counter()
+    finals = await asyncio.gather(*(play(port, f"s{i}", p, args, latencies, counts)
+                                    for i, p in enumerate(paths)))
+    wall = time.perf_counter() - start
+    sampler.cancel()
+    return wall, latencies, counts, max(peak), finals
+
+
+def run(n, args, clips, port, baseline):
+    import metrics
+    from scheduler import get_scheduler
+    before = get_scheduler().stats()
+    stages_before = metrics.STAGE_SECONDS.totals()
+    wall, latencies, counts, peak, finals = asyncio.run(run_streams(port, clips[:n], args))
+    after = get_scheduler().stats()
+    stages = {}
+    for key, (count, total) in metrics.STAGE_SECONDS.totals().items():
+        c0, t0 = stages_before.get(key, (0, 0.0))
+        if count > c0:
+            stages[key[0]] = round((total - t0) / (count - c0) * 1000, 3)
+    frames = sum(counts.values())
+    ms = [x * 1000 for x in latencies]
+    return {
+        "streams": n, "wall_seconds": round(wall, 3), "frames": frames,
+        "frames_per_second": round(frames / wall, 2),
+        "per_stream_fps": [round(counts.get(f"s{i}", 0) / wall, 2) for i in range(n)],
+        "latency_ms": {"p50": percentile(ms, 50), "p90": percentile(ms, 90), "p99": percentile(ms, 99),
+                       "max": max(ms) if ms else None},
+        "memory_mb": {"baseline": round(baseline, 1), "peak": round(peak, 1),
+                      "per_stream": round((peak - baseline) / n, 2)},
+        "stage_mean_ms": stages,
+        "scheduler": {k: after[k] - before[k] for k in ("submitted", "rejected", "completed")},
+        "stream_errors": sum(f.get("errors", 0) for f in finals if f),
+    }
+
+
+def compare(results, path):
+    with open(path) as f:
+        old = {r["streams"]: r for r in json.load(f)["results"]}
+    print(f"\nagainst {path}:")
+    for r in results:
+        o = old.get(r["streams"])
+        if o is None:
+            continue
+        for label, new_v, old_v in (("frames/s", r["frames_per_second"], o["frames_per_second"]),
+                                    ("p99 ms", r["latency_ms"]["p99"], o["latency_ms"]["p99"]),
+                                    ("MB/stream", r["memory_mb"]["per_stream"], o["memory_mb"]["per_stream"])):
+            if new_v is not None and old_v:
+                print(f"  {r['streams']:>3} streams  {label:<10} {old_v:>9.2f} -> {new_v:>9.2f}"
+                      f"  ({(new_v - old_v) / old_v:+.1%})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--streams", type=int, nargs="+", default=[1, 4])
+    ap.add_argument("--seconds", type=float, default=10.0, help="length of the generated clips")
+    ap.add_argument("--fps", type=float, default=25.0, help="frame rate of the generated clips")
+    ap.add_argument("--faces", type=int, default=2, help="faces per generated clip (at most 8)")
+    ap.add_argument("--size", default="640x480", help="resolution of the generated clips")
+    ap.add_argument("--video", help="play this file on every stream instead of generated clips")
+    ap.add_argument("--model", choices=("stub", "deepface"), default="stub")
+    ap.add_argument("--stub-ms", type=float, default=0.0, help="simulated model time per frame")
+    ap.add_argument("--max-fps", type=float, help="per-stream max_fps handshake option")
+    ap.add_argument("--fast", action="store_true", help="decode files as fast as possible, not in real time")
+    ap.add_argument("--format", choices=("json", "msgpack"), default="msgpack")
+    ap.add_argument("--options", type=json.loads, default={},
+                    help='extra handshake options for every stream, e.g. \'{"two_stage": true}\'')
+    ap.add_argument("--json", help="write the results here")
+    ap.add_argument("--compare", help="print deltas against a JSON file from an earlier run")
+    args = ap.parse_args()
+
+    # Before the app (and config) is imported; inference worker processes inherit it
+    os.environ["INFERENCE_BACKEND"] = args.model
+    os.environ["STUB_MODEL_MS"] = str(args.stub_ms)
+    os.environ.setdefault("REGISTRY_CONSOLIDATE_INTERVAL", "0")
+    tmp = tempfile.mkdtemp(prefix="e2e-bench-")
+    try:
+        # Distinct paths per stream: the server shares one pipeline between subscribers of a URL
+        clips = []
+        for i in range(max(args.streams)):
+            path = os.path.join(tmp, f"stream{i}" + (os.path.splitext(args.video)[1] if args.video else ".avi"))
+            if args.video:
+                os.symlink(os.path.abspath(args.video), path)
+            else:
+                synthetic_clip(path, args.seconds, args.fps, args.faces, seed=i,
+                               size=tuple(int(v) for v in args.size.split("x")))
+            clips.append(path)
+
+        import config
+        from scheduler import get_scheduler
+        srv, thread, port = start_server()
+        if not get_scheduler().ready.wait(300):
+            sys.exit("inference workers did not become ready")
+        baseline = rss_mb()
+        print(f"model={args.model} format={args.format} processes={config.INFERENCE_PROCESSES} "
+              f"workers={config.INFERENCE_WORKERS} cores={os.cpu_count()}")
+        print(f"{'streams':>7} {'frames/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+              f"{'peak MB':>8} {'MB/stream':>9} {'errors':>6}")
+        results = []
+        for n in args.streams:
+            r = run(n, args, clips, port, baseline)
+            results.append(r)
+            lat = r["latency_ms"]
+            print(f"{n:>7} {r['frames_per_second']:>9.1f} {lat['p50'] or 0:>8.1f} {lat['p90'] or 0:>8.1f} "
+                  f"{lat['p99'] or 0:>8.1f} {r['memory_mb']['peak']:>8.1f} "
+                  f"{r['memory_mb']['per_stream']:>9.2f} {r['stream_errors']:>6}")
+        srv.should_exit = True
+        thread.join(timeout=30)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {
+        "commit": commit, "timestamp": datetime.utcnow().isoformat(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("json", "compare")},
+        "environment": {"cores": os.cpu_count(), "inference_processes": config.INFERENCE_PROCESSES,
+                        "inference_workers": config.INFERENCE_WORKERS,
+                        "max_batch": config.INFERENCE_MAX_BATCH},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
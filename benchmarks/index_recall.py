@@ -0,0 +1,57 @@
+"""Recall vs latency of IVFIndex against ExactIndex.
+
+Identities are synthetic cluster centres; queries are noisy re-captures of
+enrolled identities, which is what get_face_id sees in practice.
+
+Run from the repo root:  python -m benchmarks.index_recall
+"""
+import argparse
+import time
+import numpy as np
+from face_index import ExactIndex, IVFIndex
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--noise", type=float, default=0.15)
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    # A handful of coarse groups (lighting, pose, demographics) so the data has structure
+    groups = rng.standard_normal((64, args.dim)) * 3.0
+    embeds = groups[rng.integers(0, len(groups), args.size)] + rng.standard_normal((args.size, args.dim))
+    ids = [f"person_{i + 1}" for i in range(args.size)]
+    targets = rng.integers(0, args.size, args.queries)
+    queries = embeds[targets] + args.noise * rng.standard_normal((args.queries, args.dim))
+
+    exact = ExactIndex()
+    exact.add_many(ids, embeds)
+    ivf = IVFIndex()
+    start = time.perf_counter()
+    for fid, e in zip(ids, embeds):
+        ivf.add(fid, e)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    truth = [exact.search(q, k=1)[0][0] for q in queries]
+    exact_ms = (time.perf_counter() - start) / len(queries) * 1e3
+
+    print(f"{args.size} identities, dim {args.dim}, {len(ivf._lists)} cells, "
+          f"incremental IVF build {build_s:.1f}s")
+    print(f"{'backend':>12} {'recall@1':>9} {'ms/query':>9} {'speedup':>8}")
+    print(f"{'exact':>12} {1.0:>9.3f} {exact_ms:>9.3f} {1.0:>7.1f}x")
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        start = time.perf_counter()
+        found = [ivf.search(q, k=1)[0][0] for q in queries]
+        ivf_ms = (time.perf_counter() - start) / len(queries) * 1e3
+        recall = np.mean([a == b for a, b in zip(found, truth)])
+        print(f"{'ivf/' + str(nprobe):>12} {recall:>9.3f} {ivf_ms:>9.3f} {exact_ms / ivf_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Per-frame throughput with N worker processes sharing one registry vs N threads in one process.
+
+Each worker runs a synthetic per-frame load: some pure-Python work standing
+in for pre/post-processing (holds the GIL), a small single-threaded numpy
+"inference" step, and a registry lookup for every face. Processes use the
+registry service (registry_service.py) over a shared registry directory,
+the way `python registry_service.py --workers N` runs the server; threads
+share the in-process registry. Every worker sees the same people, and the
+run fails if two workers disagree on an identity's person_N id.
+
+Run from the repo root:  python -m benchmarks.process_scaling [--workers 1 2 4]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(var, "1")    # one core per worker, so scaling comes from workers alone
+
+import numpy as np
+
+REGISTRY = "127.0.0.1:50556"
+PEOPLE = 64
+FACES_PER_FRAME = 4
+DIM = 128
+
+
+def frame_work(rng, weights, pool, get_face_id, stream):
+    sum(i * i for i in range(15_000))                                   # Python-side work
+    np.tanh(rng.standard_normal((64, 256), dtype=np.float32) @ weights)  # "model"
+    seen = {}
+    for k in rng.integers(PEOPLE, size=FACES_PER_FRAME):
+        emb = pool[k] + rng.normal(0, 0.02, DIM).astype(np.float32)
+        seen[int(k)] = get_face_id(emb, stream)
+    return seen
+
+
+def people():
+    return np.random.default_rng(0).standard_normal((PEOPLE, DIM)).astype(np.float32) * 3
+
+
+def run_worker(index, frames, registry_dir, ready, go, out):
+    if registry_dir:
+        os.environ["REGISTRY_DIR"] = registry_dir
+        os.environ["REGISTRY_SERVICE"] = REGISTRY
+    import face_registry
+    from face_registry import get_face_id
+    if registry_dir:
+        face_registry.service()     # connect before the clock starts
+    rng = np.random.default_rng(index)
+    pool = people()
+    weights = np.random.default_rng(1).standard_normal((256, 256)).astype(np.float32)
+    ids = {}
+    ready.put(index)
+    go.wait()       # start together, after process start-up and imports
+    for _ in range(frames):
+        ids.update(frame_work(rng, weights, pool, get_face_id, f"stream-{index}"))
+    out.put((time.perf_counter(), ids))
+
+
+def timed(workers, ready, go, out):
+    for w in workers:
+        w.start()
+    for _ in workers:
+        ready.get()
+    start = time.perf_counter()
+    go.set()
+    results = [out.get() for _ in workers]
+    for w in workers:
+        w.join()
+    return max(end for end, _ in results) - start, [ids for _, ids in results]
+
+
+def processes(n, frames, registry_dir):
+    ctx = multiprocessing.get_context("spawn")
+    ready, go, out = ctx.Queue(), ctx.Event(), ctx.Queue()
+    return timed([ctx.Process(target=run_worker, args=(i, frames, registry_dir, ready, go, out))
+                  for i in range(n)], ready, go, out)
+
+
+def threads(n, frames):
+    import queue
+    ready, go, out = queue.Queue(), threading.Event(), queue.Queue()
+    return timed([threading.Thread(target=run_worker, args=(i, frames, None, ready, go, out))
+                  for i in range(n)], ready, go, out)
+
+
+def consistent(id_maps):
+    merged = {}
+    for ids in id_maps:
+        for person, fid in ids.items():
+            if merged.setdefault(person, fid) != fid:
+                return False
+    return True
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, nargs="+",
+                    default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    ap.add_argument("--frames", type=int, default=200, help="frames per worker")
+    args = ap.parse_args()
+
+    import face_registry
+    from registry_service import serve, connect
+    registry_dir = tempfile.mkdtemp(prefix="registry-bench-")
+    os.environ["REGISTRY_DIR"] = registry_dir     # for the service only; this process stays in-memory
+    service = multiprocessing.get_context("spawn").Process(target=serve, args=(REGISTRY,))
+    service.start()
+    del os.environ["REGISTRY_DIR"]
+    try:
+        # Enrol everyone up front so both modes measure the steady state, not first sightings
+        remote = connect(REGISTRY)
+        for emb in people():
+            remote.resolve(emb, 0.6, time.time(), [])
+            face_registry.resolve(emb, 0.6)
+        print(f"{os.cpu_count()} cores, {args.frames} frames per worker, "
+              f"{FACES_PER_FRAME} faces per frame")
+        print(f"{'mode':>9} {'workers':>8} {'frames/s':>9} {'speedup':>8} {'ids agree':>10}")
+        for mode in ("threads", "processes"):
+            base = None
+            for n in args.workers:
+                if mode == "threads":
+                    wall, id_maps = threads(n, args.frames)
+                else:
+                    wall, id_maps = processes(n, args.frames, registry_dir)
+                rate = n * args.frames / wall
+                base = base or rate
+                ok = consistent(id_maps)
+                print(f"{mode:>9} {n:>8} {rate:>9.1f} {rate / base:>7.2f}x {str(ok):>10}")
+                if not ok:
+                    sys.exit("workers handed out conflicting ids for the same person")
+        print("registry service:", remote.stats())
+    finally:
+        service.terminate()
+        service.join()
+        shutil.rmtree(registry_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Match accuracy, lookup speed and memory of quantized registry indexes vs full precision.
+
+Identities are synthetic embeddings; queries are noisy re-captures of
+enrolled identities plus strangers, with the noise chosen so that a good
+share of distances land near the match threshold, where quantization error
+can flip a decision. The reference is the float32 ExactIndex; "float64" is
+the old one-np.array-per-identity layout, searched as one float64 matrix.
+
+    decision   same match / no-match outcome and same face_id as float32
+    top-1      same nearest identity as float32
+    bytes/id   embedding storage per identity (codes + scales + norms)
+
+Run from the repo root:  python -m benchmarks.quantized_index [--size 100000]
+"""
+import argparse
+import time
+import numpy as np
+from face_index import ExactIndex, QuantizedIndex
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    out = [fn(q) for q in queries]
+    return out, (time.perf_counter() - start) / len(queries) * 1e3
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--threshold", type=float, default=0.6)
+    ap.add_argument("--rerank", type=int, default=4)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Unit-scale embeddings: same-person re-captures fall around the threshold, strangers well outside
+    embeds = (rng.standard_normal((args.size, args.dim)) / np.sqrt(args.dim) * 2).astype(np.float32)
+    ids = [f"person_{i + 1}" for i in range(args.size)]
+    n_known = args.queries * 3 // 4
+    targets = rng.integers(0, args.size, n_known)
+    noise = rng.uniform(0.6, 1.4, n_known)[:, None] * args.threshold / np.sqrt(args.dim)
+    queries = np.concatenate([
+        embeds[targets] + noise * rng.standard_normal((n_known, args.dim)),
+        (rng.standard_normal((args.queries - n_known, args.dim)) / np.sqrt(args.dim) * 2),
+    ]).astype(np.float32)
+
+    exact = ExactIndex()
+    exact.add_many(ids, embeds)
+    truth, f32_ms = timed(lambda q: exact.search(q)[0], queries)
+    near = np.mean([abs(d - args.threshold) < 0.05 for _, d in truth])
+
+    def decision(hit):
+        return hit[0] if hit[1] < args.threshold else None
+
+    def refine(face_ids):
+        return [embeds[int(f.rsplit("_", 1)[1]) - 1] for f in face_ids]
+
+    print(f"{args.size} identities, dim {args.dim}, {len(queries)} queries "
+          f"({near:.0%} within 0.05 of the {args.threshold} threshold)")
+    print(f"{'index':>16} {'decision':>9} {'top-1':>7} {'ms/query':>9} {'batch ms/q':>10} {'bytes/id':>9}")
+
+    f64 = embeds.astype(np.float64)
+    f64_sq = np.einsum("ij,ij->i", f64, f64)
+
+    def search64(q):
+        q = q.astype(np.float64)
+        d2 = f64_sq - 2.0 * (f64 @ q) + q @ q
+        i = int(np.argmin(d2))
+        return ids[i], float(np.sqrt(max(d2[i], 0.0)))
+
+    found, ms = timed(search64, queries)
+    print(f"{'float64':>16} {np.mean([decision(a) == decision(b) for a, b in zip(found, truth)]):>9.4f} "
+          f"{np.mean([a[0] == b[0] for a, b in zip(found, truth)]):>7.4f} {ms:>9.3f} {'':>10} "
+          f"{f64.itemsize * args.dim + 8:>9}")
+
+    start = time.perf_counter()
+    exact.search_many(queries[:256])
+    batch_ms = (time.perf_counter() - start) / 256 * 1e3
+    print(f"{'float32':>16} {1.0:>9.4f} {1.0:>7.4f} {f32_ms:>9.3f} {batch_ms:>10.3f} {4 * args.dim + 4:>9}")
+
+    for precision in ("float16", "int8"):
+        for rerank in (0, args.rerank):
+            index = QuantizedIndex(precision, refine=refine if rerank else None, rerank=rerank)
+            index.add_many(ids, embeds)
+            found, ms = timed(lambda q: index.search(q)[0], queries)
+            start = time.perf_counter()
+            index.search_many(queries[:256])
+            batch_ms = (time.perf_counter() - start) / 256 * 1e3
+            name = precision + (f"+rerank{rerank}" if rerank else "")
+            print(f"{name:>16} {np.mean([decision(a) == decision(b) for a, b in zip(found, truth)]):>9.4f} "
+                  f"{np.mean([a[0] == b[0] for a, b in zip(found, truth)]):>7.4f} {ms:>9.3f} "
+                  f"{batch_ms:>10.3f} {index.nbytes() // args.size:>9}")
+
+
+if __name__ == "__main__":
+    main()
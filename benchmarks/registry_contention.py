@@ -0,0 +1,87 @@
+"""Registry lookups from many concurrent streams: lock-free read path vs one global lock.
+
+Every stream thread resolves a mix of faces it saw recently (stream cache
+hits), faces other streams enrolled (registry snapshot hits) and a few
+never-seen faces (enrolments). "locked" wraps each call in one process-wide
+lock, which is how lookups were serialised before the snapshot read path.
+
+Run from the repo root:  python -m benchmarks.registry_contention
+"""
+import argparse
+import threading
+import time
+import numpy as np
+import face_registry
+
+
+def run(streams, calls, regulars, new_share, dim, serialise, seed):
+    known = face_registry.known_faces.face_ids()
+    pool = np.stack([face_registry.known_faces.get(fid) for fid in known])
+    gate = threading.Lock() if serialise else None
+    latencies = [None] * streams
+    start_line = threading.Barrier(streams + 1)
+
+    def worker(i):
+        r = np.random.default_rng(seed + i)
+        mine = pool[r.choice(len(pool), regulars, replace=False)]
+        cache = face_registry.stream_cache(f"bench-{i}")
+        lat = np.empty(calls)
+        start_line.wait()
+        for c in range(calls):
+            roll = r.random()
+            if roll < new_share:
+                emb = r.standard_normal(dim).astype(np.float32) * 3
+            elif roll < 0.5:
+                emb = pool[r.integers(len(pool))] + r.normal(0, 0.01, dim).astype(np.float32)
+            else:
+                emb = mine[r.integers(regulars)] + r.normal(0, 0.01, dim).astype(np.float32)
+            t = time.perf_counter()
+            if gate is None:
+                face_registry.get_face_id(emb, f"bench-{i}", cache=cache)
+            else:
+                with gate:
+                    face_registry.get_face_id(emb, f"bench-{i}", cache=cache)
+            lat[c] = time.perf_counter() - t
+        latencies[i] = lat
+        face_registry.drop_stream(f"bench-{i}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(streams)]
+    for t in threads:
+        t.start()
+    start_line.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    lat = np.concatenate(latencies)
+    return streams * calls / wall, np.percentile(lat, 50) * 1e3, np.percentile(lat, 99) * 1e3
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--streams", type=int, default=32)
+    ap.add_argument("--calls", type=int, default=500, help="lookups per stream")
+    ap.add_argument("--identities", type=int, default=20_000)
+    ap.add_argument("--regulars", type=int, default=8, help="recurring faces per stream")
+    ap.add_argument("--new-share", type=float, default=0.02, help="share of never-seen faces")
+    ap.add_argument("--dim", type=int, default=128)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    with face_registry.lock:
+        for i, e in enumerate(rng.standard_normal((args.identities, args.dim)) * 3):
+            face_registry.known_faces.add(f"person_{face_registry.next_face_id + i}", e)
+        face_registry.next_face_id += args.identities
+        face_registry.snapshot = face_registry.known_faces.snapshot()
+
+    print(f"{args.streams} streams x {args.calls} lookups, {args.identities} identities")
+    print(f"{'mode':>10} {'lookups/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode, serialise in (("locked", True), ("lock-free", False)):
+        rate, p50, p99 = run(args.streams, args.calls, args.regulars, args.new_share,
+                             args.dim, serialise, seed=1)
+        print(f"{mode:>10} {rate:>10.0f} {p50:>8.3f} {p99:>8.3f}")
+    print("registry:", {k: v for k, v in face_registry.registry_stats.items()})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Registry lookup latency: ExactIndex vs the old per-entry dict scan.
+
+Run from the repo root:  python -m benchmarks.registry_lookup
+"""
+import argparse
+import time
+import numpy as np
+from face_index import ExactIndex
+
+
+def dict_scan(known, emb, threshold):
+    for fid, stored in known.items():
+        if np.linalg.norm(emb - np.array(stored)) < threshold:
+            return fid
+    return None
+
+
+def time_per_call(fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--scan-limit", type=int, default=100_000,
+                    help="skip the dict scan above this registry size")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    threshold = 0.6
+    print(f"{'identities':>10} {'index ms':>10} {'dict scan ms':>13} {'speedup':>8}")
+    for n in args.sizes:
+        embeds = rng.standard_normal((n, args.dim))
+        index = ExactIndex()
+        known = {}
+        for i, e in enumerate(embeds):
+            index.add(f"person_{i + 1}", e)
+            known[f"person_{i + 1}"] = e
+        # Worst case for the scan: queries never match, so every entry is visited
+        queries = rng.standard_normal((args.queries, args.dim))
+
+        t_index = time_per_call(lambda q: index.search(q, k=1), queries)
+        if n <= args.scan_limit:
+            scan_q = queries[:max(1, args.queries // 10)]
+            t_scan = time_per_call(lambda q: dict_scan(known, q, threshold), scan_q)
+            print(f"{n:>10} {t_index * 1e3:>10.3f} {t_scan * 1e3:>13.3f} {t_scan / t_index:>7.1f}x")
+        else:
+            print(f"{n:>10} {t_index * 1e3:>10.3f} {'-':>13} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Warm-start time of the memory-mapped registry vs rebuilding an in-memory index.
+
+Run from the repo root:  python -m benchmarks.registry_warm_start [--size N]
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from face_index import ExactIndex
+from registry_store import RegistryStore, MappedIndex
+
+
+def write_registry(path, embeds):
+    """Lay out the column files directly; append() per row would dominate the setup time."""
+    os.makedirs(path, exist_ok=True)
+    embeds.astype(np.float32).tofile(os.path.join(path, "embeddings.f32"))
+    np.einsum("ij,ij->i", embeds, embeds).astype(np.float32).tofile(os.path.join(path, "norms.f32"))
+    np.arange(1, len(embeds) + 1, dtype=np.int64).tofile(os.path.join(path, "ids.i64"))
+    store = RegistryStore(path)
+    store.dim = embeds.shape[1]
+    store.flush()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--dim", type=int, default=128)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'identities':>10} {'mmap open ms':>13} {'first lookup ms':>16} {'rebuild ms':>11}")
+    for n in args.size:
+        embeds = rng.standard_normal((n, args.dim)).astype(np.float32)
+        with tempfile.TemporaryDirectory() as path:
+            write_registry(path, embeds)
+            os.sync()   # keep writeback of the fresh files out of the timed section
+
+            start = time.perf_counter()
+            index = MappedIndex(RegistryStore(path))
+            open_ms = (time.perf_counter() - start) * 1e3
+            start = time.perf_counter()
+            index.search(embeds[0])
+            lookup_ms = (time.perf_counter() - start) * 1e3
+
+            start = time.perf_counter()
+            rebuilt = ExactIndex()
+            rebuilt.add_many([f"person_{i + 1}" for i in range(n)], np.fromfile(
+                os.path.join(path, "embeddings.f32"), dtype=np.float32).reshape(n, args.dim))
+            rebuild_ms = (time.perf_counter() - start) * 1e3
+            del index, rebuilt      # unmap before the directory goes away, outside the timings
+        print(f"{n:>10} {open_ms:>13.2f} {lookup_ms:>16.2f} {rebuild_ms:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
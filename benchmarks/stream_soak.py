@@ -0,0 +1,152 @@
+"""Soak test of the stream lifecycle: threads, caches and memory must come back down.
+
+Starts the app in this process (stub model, see e2e.py) and runs many
+cycles of the things clients do to streams: subscribe, switch to another
+source, stop one, stop_all, subscribe to a source that cannot be opened
+(a dead network URL, which goes through the reconnect backoff), receive
+periodic stats over both wire formats, and drop the socket without a word
+while streams are running. After the cycles it
+waits for every pipeline to wind down and checks that
+
+    threads     threading.active_count() is back at its level after warm-up
+    pipelines   the stream manager has none running, stopping or stuck
+    caches      no per-stream registry cache and no connection is left
+    memory      RSS grew by less than --max-growth MB over the whole run
+
+Exits non-zero if any check fails. Run from the repo root:
+    python -m benchmarks.stream_soak [--cycles 50] [--max-growth 50]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+from benchmarks.e2e import synthetic_clip, rss_mb, start_server
+
+DEAD_URL = "http://127.0.0.1:1/stream"
+
+
+async def recv_until(ws, decoder, kind, status=None, timeout=10):
+    """Read messages (JSON or msgpack frames) until one of this type (and status) arrives."""
+    async def wait():
+        async for message in ws:
+            if isinstance(message, bytes):
+                payloads = decoder.decode(message)
+            else:
+                payloads = json.loads(message)
+                payloads = payloads if isinstance(payloads, list) else [payloads]
+            for p in payloads:
+                if p.get("type") == kind and (status is None or p.get("status") == status):
+                    return p
+    return await asyncio.wait_for(wait(), timeout)
+
+
+async def cycle(port, clips, i):
+    import websockets
+    from wire import MsgpackDecoder
+    a, b = clips[i % len(clips)], clips[(i + 1) % len(clips)]
+    url = f"ws://127.0.0.1:{port}/ws/deepface"
+    fmt = ("json", "msgpack")[i % 2]
+    async with websockets.connect(url, max_size=None) as ws:
+        decoder = MsgpackDecoder()
+        await ws.send(json.dumps({"format": fmt, "stats": 0.5, "streams": [
+            {"id": "a", "url": a, "realtime": False}, {"id": "dead", "url": DEAD_URL}]}))
+        await recv_until(ws, decoder, "status", "started")
+        # Non-analysis payloads (nested, int-like keys) must survive the wire format too
+        stats = await recv_until(ws, decoder, "stats")
+        assert isinstance(stats["scheduler"]["batch_sizes"], dict), stats
+        await ws.send(json.dumps({"switch": {"id": "a", "url": b, "realtime": False}}))
+        await recv_until(ws, decoder, "status", "switched")
+        await ws.send(json.dumps({"stop": "a"}))
+        await ws.send(json.dumps({"stop_all": True}))
+        await recv_until(ws, decoder, "status", "all_stopped")
+    # Abrupt disconnect with streams running (and one still reconnecting)
+    ws = await websockets.connect(url, max_size=None)
+    await ws.send(json.dumps({"format": "msgpack", "streams": [
+        {"id": "x", "url": a}, {"id": "y", "url": b}, {"id": "dead", "url": DEAD_URL}]}))
+    await asyncio.sleep(0.2)
+    ws.transport.abort()
+
+
+def settle(baseline, timeout):
+    """Wait for stopped pipelines and connections to go away; returns the final thread count."""
+    from stream_manager import manager
+    from connection import connections
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if (not any(manager.threads().values()) and not connections
+                and threading.active_count() <= baseline):
+            break
+        time.sleep(0.25)
+    return threading.active_count()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--cycles", type=int, default=50)
+    ap.add_argument("--max-growth", type=float, default=50.0, help="allowed RSS growth, MB")
+    ap.add_argument("--settle", type=float, default=30.0, help="seconds to wait for cleanup at the end")
+    args = ap.parse_args()
+
+    os.environ["INFERENCE_BACKEND"] = "stub"
+    os.environ.setdefault("REGISTRY_CONSOLIDATE_INTERVAL", "0")
+    os.environ.setdefault("STREAM_RECONNECT_ATTEMPTS", "2")
+    os.environ.setdefault("STREAM_RECONNECT_DELAY", "0.1")
+    tmp = tempfile.mkdtemp(prefix="stream-soak-")
+    try:
+        clips = []
+        for i in range(3):
+            clips.append(os.path.join(tmp, f"clip{i}.avi"))
+            synthetic_clip(clips[-1], 2, 25, 2, seed=i)
+
+        import face_registry
+        from stream_manager import manager
+        from connection import connections
+        from scheduler import get_scheduler
+        srv, thread, port = start_server()
+        if not get_scheduler().ready.wait(300):
+            sys.exit("inference workers did not become ready")
+
+        asyncio.run(cycle(port, clips, 0))      # warm-up: lazily started pools and threads
+        baseline = settle(0, args.settle)
+        rss_start = rss_mb()
+        peak_threads, samples = baseline, []
+        start = time.perf_counter()
+        for i in range(args.cycles):
+            asyncio.run(cycle(port, clips, i))
+            peak_threads = max(peak_threads, threading.active_count())
+            samples.append(rss_mb())
+            if (i + 1) % 10 == 0:
+                print(f"cycle {i + 1:>4}  threads {threading.active_count():>3}  "
+                      f"rss {samples[-1]:7.1f} MB  pipelines {manager.threads()}")
+        threads = settle(baseline, args.settle)
+        rss_end = rss_mb()
+        elapsed = time.perf_counter() - start
+
+        checks = {
+            "threads": (threads <= baseline, f"{threads} after, {baseline} at start, {peak_threads} peak"),
+            "pipelines": (not any(manager.threads().values()) and not manager.pipelines(),
+                          str(manager.threads())),
+            "caches": (not face_registry.last_faces and not connections,
+                       f"{len(face_registry.last_faces)} stream caches, {len(connections)} connections"),
+            "memory": (rss_end - rss_start < args.max_growth,
+                       f"{rss_start:.1f} -> {rss_end:.1f} MB (peak {max(samples):.1f})"),
+        }
+        srv.should_exit = True
+        thread.join(timeout=30)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"\n{args.cycles} cycles in {elapsed:.1f}s")
+    for name, (ok, detail) in checks.items():
+        print(f"  {'ok  ' if ok else 'FAIL'} {name:<10} {detail}")
+    if not all(ok for ok, _ in checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+import cv2
+import config
+import metrics
+
+ANALYSIS_SIZE = (640, 480)
+
+
+def open_source(url, size=ANALYSIS_SIZE):
+    """Open url ("webcam" = device 0) as a cv2.VideoCapture.
+
+    Where the backend can, the source is asked to decode at `size` directly:
+    cameras get the resolution requested, and with CAPTURE_BACKEND=gstreamer
+    files and RTSP streams are scaled inside the decode pipeline. FFmpeg
+    cannot scale at decode time, so FrameReader resizes into a reused buffer
+    instead. CAPTURE_HW_ACCEL asks FFmpeg for a hardware decoder if one exists.
+    """
+    if url == "webcam":
+        cap = cv2.VideoCapture(0)
+        if size:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+        return cap
+    if config.CAPTURE_BACKEND == "gstreamer":
+        uri = url if "://" in url else "file://" + os.path.abspath(url)
+        scale = f" ! videoscale ! video/x-raw,width={size[0]},height={size[1]}" if size else ""
+        return cv2.VideoCapture(
+            f"uridecodebin uri={uri} ! videoconvert{scale} ! video/x-raw,format=BGR"
+            " ! appsink drop=true max-buffers=1 sync=false", cv2.CAP_GSTREAMER)
+    params = []
+    if "://" in url and hasattr(cv2, "CAP_PROP_OPEN_TIMEOUT_MSEC"):
+        params += [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, config.STREAM_IO_TIMEOUT_MS,
+                   cv2.CAP_PROP_READ_TIMEOUT_MSEC, config.STREAM_IO_TIMEOUT_MS]
+    if config.CAPTURE_HW_ACCEL and hasattr(cv2, "CAP_PROP_HW_ACCELERATION"):
+        cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG,
+                               params + [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+        if cap.isOpened():
+            return cap
+    if params:
+        return cv2.VideoCapture(url, cv2.CAP_FFMPEG, params)
+    return cv2.VideoCapture(url)
+
+
+class FrameReader:
+    """Drains a cv2.VideoCapture on its own thread, decoding only the frames that are used.
+
+    The reader grab()s every frame to keep up with the source, but only
+    retrieve()s (colour-converts and copies out) one when the analyzer is
+    waiting in read(); the others are counted in `dropped`, so slow
+    inference never lets OpenCV's internal buffer (and latency) grow.
+    Retrieved frames are written into preallocated buffers and resized to
+    `size` when the backend did not already decode at that size. A frame
+    returned by read() is only valid until the next read().
+
+    With realtime=True (recorded files) grabbing is paced at the file's own
+    frame rate instead of running through it at decode speed.
+    """
+
+    def __init__(self, cap, name="capture", size=ANALYSIS_SIZE, realtime=False):
+        self.cap = cap
+        self.name = name
+        self.size = size
+        self.frames_read = 0
+        self.retrieved = 0
+        self.dropped = 0
+        self._frame_interval = 0.0
+        if realtime:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            self._frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self._raw = None        # decoder output buffer, reused by retrieve()
+        self._out = None        # resized output buffer
+        self._frame = None
+        self._grabbed_at = 0.0
+        self.frame_time = None     # wall-clock time the frame last returned by read() was grabbed
+        self._fresh = False
+        self._waiting = False
+        self._ended = False
+        self._stop = threading.Event()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def _retrieve(self):
+        t0 = time.perf_counter()
+        ok, raw = self.cap.retrieve(self._raw)
+        if not ok:
+            return None
+        self._raw = raw
+        t1 = time.perf_counter()
+        metrics.STAGE_SECONDS.observe(t1 - t0, stage="capture")
+        if not self.size or (raw.shape[1], raw.shape[0]) == tuple(self.size):
+            return raw
+        self._out = cv2.resize(raw, tuple(self.size), dst=self._out, interpolation=cv2.INTER_AREA)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - t1, stage="resize")
+        return self._out
+
+    def _run(self):
+        due = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                if self._frame_interval:
+                    due += self._frame_interval
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        self._stop.wait(delay)
+                    elif delay < -1.0:
+                        due = time.monotonic()      # fell behind (slow disk); don't burst to catch up
+                if not self.cap.grab():
+                    break
+                grabbed_at = time.time()
+                self.frames_read += 1
+                if not self._waiting:
+                    self.dropped += 1
+                    continue
+                frame = self._retrieve()
+                if frame is None:
+                    break
+                with self._cond:
+                    # The next retrieve would reuse this frame's buffer: wait for the next read()
+                    self._waiting = False
+                    self._frame = frame
+                    self._grabbed_at = grabbed_at
+                    self._fresh = True
+                    self.retrieved += 1
+                    self._cond.notify()
+        finally:
+            # Only this thread touches the decoder, so release never races a read()
+            self.cap.release()
+            with self._cond:
+                self._ended = True
+                self._cond.notify_all()
+
+    def read(self, timeout=10.0):
+        """Block until the next frame is decoded and return it.
+
+        Returns (ok, frame) like cv2.VideoCapture.read; ok is False once the
+        source has ended or nothing arrived within timeout.
+        """
+        with self._cond:
+            self._waiting = True
+            try:
+                if not self._cond.wait_for(lambda: self._fresh or self._ended, timeout):
+                    return False, None
+            finally:
+                self._waiting = False
+            if not self._fresh:
+                return False, None
+            self._fresh = False
+            self.frame_time = self._grabbed_at
+            return True, self._frame
+
+    def stats(self):
+        return {"frames_read": self.frames_read, "retrieved": self.retrieved,
+                "dropped_frames": self.dropped}
+
+    def release(self):
+        """Ask the reader to stop; the capture is released on the reader thread."""
+        self._stop.set()
+
+    def join(self, timeout=None):
+        """Wait for the reader thread to exit; False if it is still stuck in the decoder."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
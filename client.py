@@ -1,7 +1,15 @@
-import asyncio, json, websockets
+import asyncio, json, sys, websockets
+
+# python client.py [json|msgpack]
+FORMAT = sys.argv[1] if len(sys.argv) > 1 else "json"
 
 async def main():
     uri = "ws://localhost:8000/ws/deepface"
+    decoder = None
+    if FORMAT == "msgpack":
+        from wire import MsgpackDecoder
+        decoder = MsgpackDecoder()
+
     async with websockets.connect(uri, max_size=None) as ws:
         await ws.send(json.dumps({
             "streams": [
@@ -9,11 +17,16 @@ async def main():
                     "id": "localcam",
                     "url": "webcam"   # triggers OpenCV to use cv2.VideoCapture(0)
                 }
-            ]
+            ],
+            "format": FORMAT
         }))
         try:
             async for message in ws:
-                print("recv:", message)
+                if isinstance(message, bytes) and decoder is not None:
+                    for payload in decoder.decode(message):
+                        print("recv:", payload)
+                else:
+                    print("recv:", message)
         except websockets.ConnectionClosedOK:
             print("✅ Webcam stream finished and connection closed cleanly.")
         except websockets.ConnectionClosedError as e:
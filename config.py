@@ -0,0 +1,96 @@
+import os
+
+# Face registry index: "exact" (brute force) or "ivf" (approximate, cluster-partitioned)
+FACE_INDEX_BACKEND = os.getenv("FACE_INDEX_BACKEND", "exact")
+FACE_INDEX_NLIST = int(os.getenv("FACE_INDEX_NLIST", "0"))     # 0 = ~sqrt(n) cells
+FACE_INDEX_NPROBE = int(os.getenv("FACE_INDEX_NPROBE", "8"))
+# Stored embedding precision: "float32", or "float16" / "int8" codes (2x / ~4x smaller)
+FACE_INDEX_PRECISION = os.getenv("FACE_INDEX_PRECISION", "float32")
+FACE_INDEX_RERANK = int(os.getenv("FACE_INDEX_RERANK", "4"))   # candidates re-scored per match, 0 = off
+
+# Models used by the per-frame inference stage (inference.py)
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "mtcnn")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "Facenet")
+# "deepface", or "stub": deterministic fake (stub_model.py) to benchmark the pipeline without models
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "deepface")
+STUB_MODEL_MS = float(os.getenv("STUB_MODEL_MS", "0"))     # simulated model time per frame
+# Detection defaults (detection.py); roi / min_face / detect_scale / two_stage are per-stream options
+MIN_FACE_SIZE = int(os.getenv("MIN_FACE_SIZE", "0"))       # px, smaller detections are dropped
+DETECT_SCALE = float(os.getenv("DETECT_SCALE", "1"))       # detector input scale of the analysis frame
+# Per-identity attribute cache (attributes.py): age/gender recomputed every TTL s, 0 = every frame
+ATTRIBUTE_TTL = float(os.getenv("ATTRIBUTE_TTL", "30"))
+ATTRIBUTE_MIN_SAMPLES = int(os.getenv("ATTRIBUTE_MIN_SAMPLES", "3"))   # estimates before serving from cache
+ATTRIBUTE_WINDOW = int(os.getenv("ATTRIBUTE_WINDOW", "10"))            # estimates averaged / voted over
+EMOTION_REFRESH = float(os.getenv("EMOTION_REFRESH", "1"))             # s between emotion updates
+
+# Shared inference scheduler (scheduler.py)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_PROCESSES = os.getenv("INFERENCE_PROCESSES", "1") == "1"    # 0 = thread pool
+INFERENCE_START_METHOD = os.getenv("INFERENCE_START_METHOD", "spawn")
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "8"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "20"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "64"))
+WARMUP_MODELS = os.getenv("WARMUP_MODELS", "1") == "1"    # load all models at server startup
+
+# Video decode (capture.py): "ffmpeg" (OpenCV default) or "gstreamer" (scales at decode time,
+# needs an OpenCV build with GStreamer); HW accel asks FFmpeg for a hardware decoder
+CAPTURE_BACKEND = os.getenv("CAPTURE_BACKEND", "ffmpeg")
+CAPTURE_HW_ACCEL = os.getenv("CAPTURE_HW_ACCEL", "1") == "1"
+
+# Seconds between periodic "running" status messages per stream
+STREAM_STATUS_INTERVAL = float(os.getenv("STREAM_STATUS_INTERVAL", "5"))
+
+# Stream lifecycle (stream_manager.py): dropped network sources are reopened with exponential backoff
+STREAM_RECONNECT_ATTEMPTS = int(os.getenv("STREAM_RECONNECT_ATTEMPTS", "10"))    # 0 = give up at once
+STREAM_RECONNECT_DELAY = float(os.getenv("STREAM_RECONNECT_DELAY", "1"))         # s, doubled per attempt
+STREAM_RECONNECT_MAX_DELAY = float(os.getenv("STREAM_RECONNECT_MAX_DELAY", "30"))
+STREAM_IO_TIMEOUT_MS = int(os.getenv("STREAM_IO_TIMEOUT_MS", "10000"))    # FFmpeg open/read timeout, network
+STREAM_JOIN_TIMEOUT = float(os.getenv("STREAM_JOIN_TIMEOUT", "10"))       # s before a stopping pipeline is "stuck"
+
+# Motion gating defaults (gating.py); every value can be overridden per stream in the handshake
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0.005"))   # fraction of changed pixels, 0 = off
+MOTION_PIXEL_DELTA = int(os.getenv("MOTION_PIXEL_DELTA", "12"))     # grey levels
+MOTION_MAX_SKIP = float(os.getenv("MOTION_MAX_SKIP", "5"))          # seconds before a forced refresh
+ON_STATIC = os.getenv("ON_STATIC", "resend")                        # "resend" | "suppress"
+
+# Adaptive per-stream sampling rate (rate_control.py); clients may override min/max/priority
+DEFAULT_MAX_FPS = float(os.getenv("DEFAULT_MAX_FPS", "3"))
+DEFAULT_MIN_FPS = float(os.getenv("DEFAULT_MIN_FPS", "0.5"))
+RATE_TARGET_LATENCY_MS = float(os.getenv("RATE_TARGET_LATENCY_MS", "500"))
+
+# Coalescing window for binary (msgpack) result frames, see wire.py
+WIRE_FLUSH_MS = float(os.getenv("WIRE_FLUSH_MS", "50"))
+
+# Per-connection outbound queue (connection.py); clients may override both in the handshake
+OUTBOX_SIZE = int(os.getenv("OUTBOX_SIZE", "256"))
+OUTBOX_POLICY = os.getenv("OUTBOX_POLICY", "drop-oldest")   # drop-oldest | drop-newest | coalesce
+
+# Persistent face registry (registry_store.py); empty = in-memory only, lost on restart
+REGISTRY_DIR = os.getenv("REGISTRY_DIR", "")
+REGISTRY_COMPACT_RATIO = float(os.getenv("REGISTRY_COMPACT_RATIO", "0.2"))   # tombstone share
+
+# Offline batch jobs (batch_jobs.py, POST /jobs)
+BATCH_SAMPLE_FPS = float(os.getenv("BATCH_SAMPLE_FPS", "5"))      # frames analysed per video second, 0 = all
+BATCH_CHUNK_FRAMES = int(os.getenv("BATCH_CHUNK_FRAMES", "300"))    # frames per parallel decode chunk
+BATCH_DECODE_WORKERS = int(os.getenv("BATCH_DECODE_WORKERS", str(os.cpu_count() or 2)))
+BATCH_READAHEAD_FRAMES = int(os.getenv("BATCH_READAHEAD_FRAMES", "256"))  # decoded frames held per job (~0.9 MB each)
+BATCH_IN_FLIGHT = int(os.getenv("BATCH_IN_FLIGHT", "16"))           # frames queued for inference per job
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "1"))        # jobs run at the same time
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", "batch_results")
+BATCH_ROOT = os.getenv("BATCH_ROOT", "")                            # if set, jobs may only read below it
+
+# Multi-process mode (registry_service.py): "host:port" of the process that owns the registry
+REGISTRY_SERVICE = os.getenv("REGISTRY_SERVICE", "")
+# Shared secret for the service (it unpickles what clients send); the launcher generates one when unset
+REGISTRY_AUTHKEY = os.getenv("REGISTRY_AUTHKEY", "").encode()
+
+# Registry bounds and upkeep (face_registry.py)
+REGISTRY_CAPACITY = int(os.getenv("REGISTRY_CAPACITY", "100000"))       # identities, 0 = unbounded
+REGISTRY_EVICTION = os.getenv("REGISTRY_EVICTION", "lru")                # "lru" | "lfu"
+REGISTRY_EVICT_BATCH = float(os.getenv("REGISTRY_EVICT_BATCH", "0.05"))  # share evicted per overflow
+REGISTRY_CENTROID_WINDOW = int(os.getenv("REGISTRY_CENTROID_WINDOW", "50"))
+REGISTRY_MERGE_THRESHOLD = float(os.getenv("REGISTRY_MERGE_THRESHOLD", "0.6"))
+REGISTRY_CONSOLIDATE_INTERVAL = float(os.getenv("REGISTRY_CONSOLIDATE_INTERVAL", "60"))  # s, 0 = off
+REGISTRY_SNAPSHOT_INTERVAL = float(os.getenv("REGISTRY_SNAPSHOT_INTERVAL", "0.5"))  # s between snapshot swaps
+REGISTRY_PENDING_MAX = int(os.getenv("REGISTRY_PENDING_MAX", "256"))   # queued hits before a reader applies them
+STREAM_CACHE_SIZE = int(os.getenv("STREAM_CACHE_SIZE", "32"))          # recent faces remembered per stream
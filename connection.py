@@ -0,0 +1,150 @@
+import time
+import asyncio
+import itertools
+import threading
+import weakref
+from collections import deque
+import config
+import metrics
+import wire
+
+POLICIES = ("drop-oldest", "drop-newest", "coalesce")
+
+connections = weakref.WeakSet()    # live Connection objects, for /connections
+_ids = itertools.count(1)          # Connection.id, never reused within a process
+
+
+class Connection:
+    """One /ws/deepface socket: negotiated wire format plus a bounded outbound queue.
+
+    Analyzer threads call send(), which only appends to the queue and never
+    blocks. A drain task on the event loop empties it: in "json" mode every
+    payload goes out as its own message, in "msgpack" mode everything queued
+    within flush_interval is coalesced into one binary frame.
+
+    When the queue is full the overflow policy decides what is lost:
+    "drop-oldest" evicts the oldest queued payload, "drop-newest" discards the
+    incoming one, and "coalesce" replaces the queued analysis of the same
+    stream (falling back to drop-oldest), so a slow client sees fewer but
+    current results.
+    """
+
+    def __init__(self, websocket, loop, fmt="json", flush_ms=None, max_queue=None, policy=None):
+        self.id = next(_ids)
+        self.websocket = websocket
+        self.loop = loop
+        self.format = fmt
+        self.flush_interval = (config.WIRE_FLUSH_MS if flush_ms is None else flush_ms) / 1000.0
+        self.max_queue = int(config.OUTBOX_SIZE if max_queue is None else max_queue)
+        self.policy = policy if policy in POLICIES else config.OUTBOX_POLICY
+        self._encoder = wire.MsgpackEncoder() if fmt == "msgpack" else None
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._drainer = None
+        self._closed = False
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.send_errors = 0
+        self.high_watermark = 0
+        connections.add(self)
+
+    @classmethod
+    def negotiate(cls, websocket, loop, handshake):
+        """Pick the wire format and outbox settings requested in the handshake."""
+        fmt = handshake.get("format", "json")
+        if not wire.available(fmt):
+            fmt = "json"
+        flush_ms, max_queue = handshake.get("flush_ms"), handshake.get("outbox_size")
+        if flush_ms is not None and not (isinstance(flush_ms, (int, float)) and 0 <= flush_ms <= 1000):
+            raise ValueError(f"flush_ms must be a number of milliseconds in [0, 1000], got {flush_ms!r}")
+        if max_queue is not None and not (isinstance(max_queue, int) and max_queue >= 1):
+            raise ValueError(f"outbox_size must be a positive integer, got {max_queue!r}")
+        policy = handshake.get("overflow")
+        if policy is not None and policy not in POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(POLICIES)}, got {policy!r}")
+        return cls(websocket, loop, fmt, flush_ms, max_queue, policy)
+
+    def start(self):
+        self._drainer = self.loop.create_task(self._drain())
+
+    def _evict_same_stream(self, payload):
+        sid = payload.get("stream_id")
+        for i, queued in enumerate(self._queue):
+            if queued.get("type") == "analysis" and queued.get("stream_id") == sid:
+                del self._queue[i]
+                return True
+        return False
+
+    def send(self, payload: dict):
+        """Queue one payload for delivery. Safe from any thread, never blocks."""
+        if self._closed:
+            return
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                if self.policy == "drop-newest":
+                    self.dropped += 1
+                    return
+                if (self.policy == "coalesce" and payload.get("type") == "analysis"
+                        and self._evict_same_stream(payload)):
+                    self.coalesced += 1
+                else:
+                    self._queue.popleft()
+                    self.dropped += 1
+            was_empty = not self._queue
+            self._queue.append(payload)
+            self.queued += 1
+            self.high_watermark = max(self.high_watermark, len(self._queue))
+        if was_empty:
+            self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _take_all(self):
+        with self._lock:
+            batch = list(self._queue)
+            self._queue.clear()
+        return batch
+
+    async def _drain(self):
+        try:
+            while not self._closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if self._encoder is not None:
+                    await asyncio.sleep(self.flush_interval)   # coalescing window
+                    batch = self._take_all()
+                    if batch:
+                        t0 = time.perf_counter()
+                        await self.websocket.send_bytes(self._encoder.encode(batch))
+                        metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="send")
+                        self.sent += len(batch)
+                    continue
+                for payload in self._take_all():
+                    t0 = time.perf_counter()
+                    await self.websocket.send_json(payload)
+                    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="send")
+                    self.sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Socket is gone; stop accepting work so producers don't queue into the void
+            self.send_errors += 1
+            metrics.ERRORS.inc(where="send", error=type(e).__name__)
+            self._closed = True
+
+    def stats(self):
+        with self._lock:
+            depth = len(self._queue)
+        return {
+            "id": self.id, "format": self.format, "policy": self.policy,
+            "depth": depth, "capacity": self.max_queue, "high_watermark": self.high_watermark,
+            "queued": self.queued, "sent": self.sent, "dropped": self.dropped,
+            "coalesced": self.coalesced, "send_errors": self.send_errors,
+        }
+
+    async def close(self):
+        self._closed = True
+        if self._drainer is not None:
+            self._drainer.cancel()
+        connections.discard(self)
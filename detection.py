@@ -0,0 +1,61 @@
+import config
+from capture import ANALYSIS_SIZE
+
+
+class DetectionSettings:
+    """Where, and at what resolution, a stream's frames are searched for faces.
+
+    `roi` is one [x, y, w, h] or a list of them, as fractions of the frame;
+    only those regions go through the detector. Faces smaller than
+    `min_face` pixels (shorter side, in the coordinates results are reported
+    in) are dropped. The detector sees the frame, or each region, resized by
+    `detect_scale`.
+
+    With `two_stage` the stream keeps frames at source resolution: detection
+    runs on a copy scaled down to about the usual analysis width (unless
+    detect_scale says otherwise) and attributes and embeddings are computed
+    on the full-resolution face crops. Regions are then reported in source
+    pixels.
+    """
+
+    def __init__(self, roi=None, min_face=None, detect_scale=None, two_stage=False):
+        if roi and not isinstance(roi[0], (list, tuple)):
+            roi = [roi]
+        self.roi = [tuple(float(v) for v in r) for r in roi or ()]
+        for x, y, w, h in self.roi:
+            if not (0 <= x < 1 and 0 <= y < 1 and 0 < w and 0 < h and x + w <= 1.0001 and y + h <= 1.0001):
+                raise ValueError(f"roi must be [x, y, w, h] fractions inside the frame, got {[x, y, w, h]}")
+        self.min_face = config.MIN_FACE_SIZE if min_face is None else int(min_face)
+        self.scale = None if detect_scale is None else float(detect_scale)
+        if self.scale is not None and not 0 < self.scale <= 4:
+            raise ValueError(f"detect_scale must be in (0, 4], got {self.scale}")
+        self.two_stage = bool(two_stage)
+        self._shape = None
+        self._params = None
+
+    @classmethod
+    def from_options(cls, options):
+        """Build from the per-stream `streams` handshake entry."""
+        return cls(options.get("roi"), options.get("min_face"), options.get("detect_scale"),
+                   options.get("two_stage", False))
+
+    @property
+    def capture_size(self):
+        """Size FrameReader should deliver frames at; None keeps the source resolution."""
+        return None if self.two_stage else ANALYSIS_SIZE
+
+    def params(self, frame):
+        """Keyword arguments for inference.detect_faces, resolved for this frame's size."""
+        if frame.shape[:2] != self._shape:
+            h, w = self._shape = frame.shape[:2]
+            scale = self.scale
+            if scale is None:
+                scale = min(1.0, ANALYSIS_SIZE[0] / w) if self.two_stage else config.DETECT_SCALE
+            rois = [(int(x * w), int(y * h), min(w, int((x + rw) * w)), min(h, int((y + rh) * h)))
+                    for x, y, rw, rh in self.roi]
+            self._params = {"roi": rois or None, "min_face": self.min_face, "scale": scale}
+        return self._params
+
+    def stats(self):
+        return {"roi": self.roi or None, "min_face": self.min_face, "two_stage": self.two_stage,
+                "detect_scale": self._params["scale"] if self._params else self.scale}
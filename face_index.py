@@ -0,0 +1,488 @@
+import numpy as np
+import config
+
+
+class FaceIndex:
+    """Interface for the embedding index beneath face_registry.get_face_id."""
+
+    size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, face_id, embedding):
+        raise NotImplementedError
+
+    def search(self, embedding, k=1):
+        """Return up to k (face_id, distance) pairs, nearest first."""
+        raise NotImplementedError
+
+    def search_many(self, embeddings, k=1):
+        """search() for each row of embeddings."""
+        return [self.search(e, k) for e in embeddings]
+
+    def get(self, face_id):
+        """Stored embedding of face_id, or None."""
+        raise NotImplementedError
+
+    def update(self, face_id, embedding):
+        """Replace the stored embedding of face_id (e.g. with its running centroid)."""
+        raise NotImplementedError
+
+    def remove(self, face_id):
+        """Drop face_id; returns False if it was not present."""
+        raise NotImplementedError
+
+    def face_ids(self):
+        """All stored face ids."""
+        raise NotImplementedError
+
+    def snapshot(self):
+        """Read-only copy that stays valid while this index keeps changing."""
+        raise NotImplementedError
+
+
+def top_k(d2, k):
+    """Row indexes of the k smallest entries of d2, nearest first."""
+    n = len(d2)
+    if k == 1:
+        return [int(np.argmin(d2))]
+    k = min(k, n)
+    part = np.argpartition(d2, k - 1)[:k] if k < n else np.arange(n)
+    return part[np.argsort(d2[part])].tolist()
+
+
+class ExactIndex(FaceIndex):
+    """Contiguous, growable float32 embedding matrix with a batched distance lookup."""
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.size = 0
+        self.ids = []
+        self._rows = {}         # face_id -> row
+        self._vecs = None       # (capacity, dim) float32, rows [0, size) are live
+        self._sq_norms = None   # (capacity,) float32, cached ||v||^2 per row
+
+    def _reserve(self, dim, extra=1):
+        need = self.size + extra
+        if self._vecs is None:
+            cap = max(self.capacity, need)
+            self._vecs = np.empty((cap, dim), dtype=np.float32)
+            self._sq_norms = np.empty(cap, dtype=np.float32)
+        elif need > len(self._vecs):
+            cap = max(2 * len(self._vecs), need)
+            vecs = np.empty((cap, dim), dtype=np.float32)
+            vecs[:self.size] = self._vecs[:self.size]
+            sq_norms = np.empty(cap, dtype=np.float32)
+            sq_norms[:self.size] = self._sq_norms[:self.size]
+            self._vecs, self._sq_norms = vecs, sq_norms
+
+    def add(self, face_id, embedding):
+        emb = np.asarray(embedding, dtype=np.float32).ravel()
+        self._reserve(emb.shape[0])
+        self._vecs[self.size] = emb
+        self._sq_norms[self.size] = emb @ emb
+        self.ids.append(face_id)
+        self._rows[face_id] = self.size
+        self.size += 1
+
+    def add_many(self, face_ids, embeddings):
+        embs = np.asarray(embeddings, dtype=np.float32)
+        if not len(face_ids):
+            return
+        self._reserve(embs.shape[1], len(face_ids))
+        end = self.size + len(face_ids)
+        self._vecs[self.size:end] = embs
+        self._sq_norms[self.size:end] = np.einsum("ij,ij->i", embs, embs)
+        self._rows.update((fid, self.size + i) for i, fid in enumerate(face_ids))
+        self.ids.extend(face_ids)
+        self.size = end
+
+    def vectors(self):
+        """View of the live rows, aligned with self.ids."""
+        if self._vecs is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._vecs[:self.size]
+
+    def search(self, embedding, k=1):
+        if not self.size:
+            return []
+        q = np.asarray(embedding, dtype=np.float32).ravel()
+        n = self.size
+        # ||v - q||^2 = ||v||^2 - 2 v.q + ||q||^2, one matrix-vector product for all rows
+        d2 = self._sq_norms[:n] - 2.0 * (self._vecs[:n] @ q) + (q @ q)
+        np.maximum(d2, 0.0, out=d2)
+        return [(self.ids[i], float(np.sqrt(d2[i]))) for i in top_k(d2, k)]
+
+    def search_many(self, embeddings, k=1):
+        if not self.size:
+            return [[] for _ in embeddings]
+        qs = np.asarray(embeddings, dtype=np.float32)
+        n = self.size
+        d2 = self._sq_norms[:n] - 2.0 * (qs @ self._vecs[:n].T) + np.einsum("ij,ij->i", qs, qs)[:, None]
+        np.maximum(d2, 0.0, out=d2)
+        return [[(self.ids[i], float(np.sqrt(row[i]))) for i in top_k(row, k)] for row in d2]
+
+    def get(self, face_id):
+        row = self._rows.get(face_id)
+        return None if row is None else self._vecs[row].copy()
+
+    def update(self, face_id, embedding):
+        row = self._rows[face_id]
+        emb = np.asarray(embedding, dtype=np.float32).ravel()
+        self._vecs[row] = emb
+        self._sq_norms[row] = emb @ emb
+
+    def remove(self, face_id):
+        row = self._rows.pop(face_id, None)
+        if row is None:
+            return False
+        last = self.size - 1
+        if row != last:
+            # Move the last row into the hole so live rows stay contiguous
+            self._vecs[row] = self._vecs[last]
+            self._sq_norms[row] = self._sq_norms[last]
+            moved = self.ids[last]
+            self.ids[row] = moved
+            self._rows[moved] = row
+        self.ids.pop()
+        self.size = last
+        return True
+
+    def face_ids(self):
+        return list(self.ids)
+
+    def snapshot(self):
+        snap = ExactIndex(capacity=max(self.size, 1))
+        if self.size:
+            snap.size = self.size
+            snap.ids = list(self.ids)
+            snap._rows = dict(self._rows)
+            snap._vecs = self._vecs[:self.size].copy()
+            snap._sq_norms = self._sq_norms[:self.size].copy()
+        return snap
+
+
+class QuantizedIndex(ExactIndex):
+    """ExactIndex storing float16 or int8 codes instead of float32 rows.
+
+    int8 rows keep a per-row scale (v ~ codes * scale), so memory per
+    identity is dim + 8 bytes instead of 4 * dim + 4. Distances are
+    asymmetric: the float32 query is compared with the decoded rows, block by
+    block so no full float32 copy of the matrix is ever made. With `refine`
+    (face_ids -> float32 rows, e.g. the registry store's files) the best
+    `rerank` candidates per result are re-scored on full precision, so matches
+    near the threshold are decided on exact distances. numpy decodes float16
+    far slower than int8, so float16 only pays off for batched searches.
+    """
+
+    BLOCK = 4096    # rows decoded per step of a search
+
+    def __init__(self, precision="int8", capacity=1024, refine=None, rerank=4):
+        if precision not in ("float16", "int8"):
+            raise ValueError(f"unknown index precision: {precision!r}")
+        super().__init__(capacity)
+        self.precision = precision
+        self.refine = refine
+        self.rerank = rerank
+        self._scales = None     # (capacity,) float32 per-row scale (1 for float16)
+
+    def _reserve(self, dim, extra=1):
+        need = self.size + extra
+        dtype = np.int8 if self.precision == "int8" else np.float16
+        if self._vecs is None:
+            cap = max(self.capacity, need)
+            self._vecs = np.empty((cap, dim), dtype=dtype)
+            self._scales = np.empty(cap, dtype=np.float32)
+            self._sq_norms = np.empty(cap, dtype=np.float32)
+        elif need > len(self._vecs):
+            cap = max(2 * len(self._vecs), need)
+            vecs = np.empty((cap, dim), dtype=dtype)
+            vecs[:self.size] = self._vecs[:self.size]
+            scales = np.empty(cap, dtype=np.float32)
+            scales[:self.size] = self._scales[:self.size]
+            sq_norms = np.empty(cap, dtype=np.float32)
+            sq_norms[:self.size] = self._sq_norms[:self.size]
+            self._vecs, self._scales, self._sq_norms = vecs, scales, sq_norms
+
+    def _encode(self, embs):
+        """(codes, scales, squared norms of the decoded rows) for a (n, dim) float32 block."""
+        if self.precision == "float16":
+            codes = embs.astype(np.float16)
+            scales = np.ones(len(embs), dtype=np.float32)
+        else:
+            scales = np.abs(embs).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.rint(embs / scales[:, None]).astype(np.int8)
+        decoded = codes.astype(np.float32) * scales[:, None]
+        return codes, scales.astype(np.float32), np.einsum("ij,ij->i", decoded, decoded)
+
+    def _write(self, start, embs):
+        end = start + len(embs)
+        self._vecs[start:end], self._scales[start:end], self._sq_norms[start:end] = self._encode(embs)
+
+    def add(self, face_id, embedding):
+        emb = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        self._reserve(emb.shape[1])
+        self._write(self.size, emb)
+        self.ids.append(face_id)
+        self._rows[face_id] = self.size
+        self.size += 1
+
+    def add_many(self, face_ids, embeddings):
+        embs = np.asarray(embeddings, dtype=np.float32)
+        if not len(face_ids):
+            return
+        self._reserve(embs.shape[1], len(face_ids))
+        self._write(self.size, embs)
+        self._rows.update((fid, self.size + i) for i, fid in enumerate(face_ids))
+        self.ids.extend(face_ids)
+        self.size += len(face_ids)
+
+    def vectors(self):
+        """Decoded float32 copy of the live rows, aligned with self.ids."""
+        if self._vecs is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._vecs[:self.size].astype(np.float32) * self._scales[:self.size, None]
+
+    def _d2(self, qs):
+        """(len(qs), size) squared distances from float32 queries to the decoded rows."""
+        n = self.size
+        dots = np.empty((len(qs), n), dtype=np.float32)
+        for start in range(0, n, self.BLOCK):
+            block = self._vecs[start:min(start + self.BLOCK, n)].astype(np.float32)
+            np.matmul(qs, block.T, out=dots[:, start:start + len(block)])
+        d2 = self._sq_norms[:n] - 2.0 * self._scales[:n] * dots + np.einsum("ij,ij->i", qs, qs)[:, None]
+        return np.maximum(d2, 0.0, out=d2)
+
+    def _ranked(self, q, row, k):
+        if self.refine is None or not self.rerank:
+            return [(self.ids[i], float(np.sqrt(row[i]))) for i in top_k(row, k)]
+        cand = top_k(row, k * self.rerank)
+        ids = [self.ids[i] for i in cand]
+        exact = self.refine(ids)
+        hits = []
+        for fid, i, vec in zip(ids, cand, exact):
+            d2 = row[i] if vec is None else float(((vec - q) ** 2).sum())
+            hits.append((fid, float(np.sqrt(d2))))
+        hits.sort(key=lambda h: h[1])
+        return hits[:k]
+
+    def search(self, embedding, k=1):
+        if not self.size:
+            return []
+        q = np.asarray(embedding, dtype=np.float32).ravel()
+        return self._ranked(q, self._d2(q[None, :])[0], k)
+
+    def search_many(self, embeddings, k=1):
+        if not self.size:
+            return [[] for _ in embeddings]
+        qs = np.asarray(embeddings, dtype=np.float32)
+        return [self._ranked(q, row, k) for q, row in zip(qs, self._d2(qs))]
+
+    def get(self, face_id):
+        row = self._rows.get(face_id)
+        if row is None:
+            return None
+        if self.refine is not None:
+            vec = self.refine([face_id])[0]
+            if vec is not None:
+                return vec
+        return self._vecs[row].astype(np.float32) * self._scales[row]
+
+    def update(self, face_id, embedding):
+        self._write(self._rows[face_id], np.asarray(embedding, dtype=np.float32).reshape(1, -1))
+
+    def remove(self, face_id):
+        row = self._rows.get(face_id)
+        last = self.size - 1
+        if row is not None and row != last:
+            self._scales[row] = self._scales[last]
+        return super().remove(face_id)
+
+    def snapshot(self):
+        snap = QuantizedIndex(self.precision, capacity=max(self.size, 1), refine=self.refine,
+                              rerank=self.rerank)
+        if self.size:
+            snap.size = self.size
+            snap.ids = list(self.ids)
+            snap._rows = dict(self._rows)
+            snap._vecs = self._vecs[:self.size].copy()
+            snap._scales = self._scales[:self.size].copy()
+            snap._sq_norms = self._sq_norms[:self.size].copy()
+        return snap
+
+    def nbytes(self):
+        """Bytes held for the live rows: codes, scales and norms."""
+        if self._vecs is None:
+            return 0
+        return self.size * (self._vecs.shape[1] * self._vecs.itemsize + 8)
+
+
+def _nearest_centroid(x, centroids, chunk=8192):
+    """Row-wise argmin of squared distance from x to centroids."""
+    c_sq = np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk):
+        block = x[start:start + chunk]
+        labels[start:start + chunk] = np.argmin(c_sq - 2.0 * (block @ centroids.T), axis=1)
+    return labels
+
+
+def _kmeans(x, k, iters, rng):
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        labels = _nearest_centroid(x, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=k)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        sums = np.add.reduceat(x[order], starts, axis=0)
+        # Empty clusters keep their previous centroid
+        centroids[filled] = sums / counts[filled, None]
+    return centroids
+
+
+class IVFIndex(FaceIndex):
+    """Approximate index: vectors partitioned by k-means cell, search probes the nearest cells.
+
+    Until train_min vectors have been added everything lives in one flat
+    ExactIndex. After that each insert goes straight to its nearest cell, and
+    the partition is re-clustered whenever the index grows by retrain_factor.
+    """
+
+    def __init__(self, nlist=0, nprobe=8, train_min=2048, retrain_factor=4.0,
+                 kmeans_iters=10, seed=0, precision="float32", refine=None):
+        self.nlist = nlist              # 0 = about sqrt(n) cells at each training
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self.retrain_factor = retrain_factor
+        self.kmeans_iters = kmeans_iters
+        self.size = 0
+        self._rng = np.random.default_rng(seed)
+        self.precision = precision      # of the cells: "float32", "float16" or "int8"
+        self.refine = refine
+        self._flat = self._new_cell()
+        self._centroids = None
+        self._c_sq = None
+        self._lists = []
+        self._cell = {}                 # face_id -> cell, once trained
+        self._trained_at = 0
+
+    def _new_cell(self, capacity=1024):
+        if self.precision == "float32":
+            return ExactIndex(capacity)
+        return QuantizedIndex(self.precision, capacity, refine=self.refine, rerank=config.FACE_INDEX_RERANK)
+
+    def _all(self):
+        if self._centroids is None:
+            return list(self._flat.ids), self._flat.vectors()
+        ids = [fid for lst in self._lists for fid in lst.ids]
+        if not ids:
+            return [], np.empty((0, 0), dtype=np.float32)
+        vecs = np.concatenate([lst.vectors() for lst in self._lists if lst.size])
+        return ids, vecs
+
+    def _train(self):
+        ids, vecs = self._all()
+        n = len(ids)
+        k = self.nlist or int(np.sqrt(n))
+        k = max(1, min(k, n))
+        # Cluster on a sample; 64 points per cell is plenty for stable centroids
+        sample = vecs if n <= 64 * k else vecs[self._rng.choice(n, 64 * k, replace=False)]
+        centroids = _kmeans(sample, k, self.kmeans_iters, self._rng)
+        labels = _nearest_centroid(vecs, centroids)
+
+        lists = [self._new_cell(capacity=64) for _ in range(k)]
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(k + 1))
+        for c in range(k):
+            rows = order[bounds[c]:bounds[c + 1]]
+            lists[c].add_many([ids[i] for i in rows], vecs[rows])
+
+        self._centroids = centroids
+        self._c_sq = np.einsum("ij,ij->i", centroids, centroids)
+        self._lists = lists
+        self._cell = {fid: int(c) for fid, c in zip(ids, labels)}
+        self._flat = None
+        self._trained_at = n
+
+    def add(self, face_id, embedding):
+        emb = np.asarray(embedding, dtype=np.float32).ravel()
+        self.size += 1
+        if self._centroids is None:
+            self._flat.add(face_id, emb)
+            if self.size >= self.train_min:
+                self._train()
+            return
+        cell = int(np.argmin(self._c_sq - 2.0 * (self._centroids @ emb)))
+        self._lists[cell].add(face_id, emb)
+        self._cell[face_id] = cell
+        if self.size >= self.retrain_factor * self._trained_at:
+            self._train()
+
+    def search(self, embedding, k=1):
+        q = np.asarray(embedding, dtype=np.float32).ravel()
+        if self._centroids is None:
+            return self._flat.search(q, k)
+        d2c = self._c_sq - 2.0 * (self._centroids @ q)
+        nprobe = min(self.nprobe, len(d2c))
+        probe = np.argpartition(d2c, nprobe - 1)[:nprobe] if nprobe < len(d2c) else range(len(d2c))
+        hits = []
+        for cell in probe:
+            hits.extend(self._lists[cell].search(q, k))
+        hits.sort(key=lambda h: h[1])
+        return hits[:k]
+
+    def _holder(self, face_id):
+        if self._centroids is None:
+            return self._flat
+        cell = self._cell.get(face_id)
+        return None if cell is None else self._lists[cell]
+
+    def get(self, face_id):
+        holder = self._holder(face_id)
+        return None if holder is None else holder.get(face_id)
+
+    def update(self, face_id, embedding):
+        # Stays in its cell; drift is corrected at the next re-clustering
+        self._holder(face_id).update(face_id, embedding)
+
+    def remove(self, face_id):
+        holder = self._holder(face_id)
+        if holder is None or not holder.remove(face_id):
+            return False
+        self._cell.pop(face_id, None)
+        self.size -= 1
+        return True
+
+    def face_ids(self):
+        return self._all()[0] if self._centroids is None else list(self._cell)
+
+    def snapshot(self):
+        snap = IVFIndex.__new__(IVFIndex)
+        snap.__dict__.update(self.__dict__)
+        # Centroids are replaced, never modified in place, so only the cells need copying
+        if self._centroids is None:
+            snap._flat = self._flat.snapshot()
+        else:
+            snap._lists = [lst.snapshot() for lst in self._lists]
+            snap._cell = dict(self._cell)
+        return snap
+
+
+def make_index(backend=None, precision=None, refine=None):
+    """Build the registry index selected by config.FACE_INDEX_BACKEND and FACE_INDEX_PRECISION.
+
+    refine (face_ids -> full-precision rows) is used to re-rank quantized results.
+    """
+    backend = backend or config.FACE_INDEX_BACKEND
+    precision = precision or config.FACE_INDEX_PRECISION
+    if backend == "exact":
+        if precision == "float32":
+            return ExactIndex()
+        return QuantizedIndex(precision, refine=refine, rerank=config.FACE_INDEX_RERANK)
+    if backend == "ivf":
+        return IVFIndex(nlist=config.FACE_INDEX_NLIST, nprobe=config.FACE_INDEX_NPROBE,
+                        precision=precision, refine=refine)
+    raise ValueError(f"unknown face index backend: {backend!r}")
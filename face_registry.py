@@ -1,42 +1,352 @@
 import time
+import queue
+import atexit
 import threading
 import numpy as np
+import config
+import metrics
+from face_index import make_index
+from registry_store import MappedIndex, RegistryStore, open_index
 
-known_faces = {}   # {face_id: embedding}
-next_face_id = 1
-lock = threading.Lock()
-last_faces = {}    # {stream_id: [ { "face_id": ..., "embedding": ..., "last_seen": ... } ]}
+if config.REGISTRY_SERVICE:
+    # Worker of a multi-process server: registry_service owns the registry and hands out ids.
+    # With a registry directory this process searches the service's files read-only.
+    store = RegistryStore(config.REGISTRY_DIR, readonly=True) if config.REGISTRY_DIR else None
+    known_faces = MappedIndex(store) if store is not None else make_index()
+    next_face_id = None
+elif config.REGISTRY_DIR:
+    # Persistent registry: maps the on-disk files, so ids survive restarts
+    store = RegistryStore(config.REGISTRY_DIR)
+    known_faces = open_index(store)
+    next_face_id = store.next_face_id
+else:
+    store = None
+    known_faces = make_index()   # face_id -> embedding, backend from config.FACE_INDEX_BACKEND
+    next_face_id = 1
+lock = threading.Lock()       # writers only; lookups read `snapshot` and never take it
+snapshot = known_faces.snapshot()
+last_faces = {}    # {stream_id: StreamCache}
+face_stats = {}    # {face_id: [hits, last_seen, samples]}; samples = embeddings in the centroid
+                   # identities loaded from disk start at [0, load time, 1]
+registry_stats = {"evicted": 0, "merged": 0, "consolidation_passes": 0,
+                  "cache_hits": 0, "snapshot_hits": 0, "slow_path": 0, "snapshots": 1}
+_pending = queue.SimpleQueue()   # (face_id, embedding, seen) snapshot hits awaiting a writer
+_dirty = False
+_changed = set()    # face_ids enrolled or moved since the last consolidation pass
+_published_at = time.time()
+_loaded_at = time.time()
+_consolidator = None
+_service = None     # registry_service proxy, connected on first use
 
-def get_face_id(embedding, stream_id, threshold=0.6, cache_ttl=5.0):
-    """Compare embedding to cache + registry. Return stable face_id."""
-    global next_face_id
-    now = time.time()
-    emb = np.array(embedding)
 
-    if stream_id not in last_faces:
-        last_faces[stream_id] = []
+class StreamCache:
+    """Faces recently resolved on one stream, in small preallocated arrays.
 
-    # 1. Check per-stream recent cache
-    for entry in last_faces[stream_id]:
-        dist = np.linalg.norm(emb - np.array(entry["embedding"]))
-        if dist < threshold:
-            entry["last_seen"] = now
-            return entry["face_id"]
+    Owned by the stream's thread and only read and written there (eviction
+    and merges elsewhere just retarget or expire a slot), so lookups take no
+    lock. When full, the least recently seen slot is reused.
+    """
+
+    def __init__(self, capacity=None, ttl=5.0):
+        self.capacity = capacity or config.STREAM_CACHE_SIZE
+        self.ttl = ttl
+        self.ids = [None] * self.capacity
+        self.vecs = None                                # (capacity, dim) float32, on first insert
+        self.last_seen = np.full(self.capacity, -np.inf)
+        self._d2 = np.empty(self.capacity, dtype=np.float32)
+
+    def lookup(self, emb, now, threshold):
+        if self.vecs is None:
+            return None
+        diff = self.vecs - emb
+        np.einsum("ij,ij->i", diff, diff, out=self._d2)
+        self._d2[now - self.last_seen >= self.ttl] = np.inf
+        i = int(np.argmin(self._d2))
+        if self._d2[i] >= threshold * threshold:
+            return None
+        self.last_seen[i] = now
+        return self.ids[i]
+
+    def insert(self, face_id, emb, now):
+        if self.vecs is None:
+            self.vecs = np.zeros((self.capacity, emb.shape[0]), dtype=np.float32)
+        i = int(np.argmin(self.last_seen))
+        self.vecs[i] = emb
+        self.ids[i] = face_id
+        self.last_seen[i] = now
+
+    def forget(self, face_id, replacement=None):
+        for i, fid in enumerate(self.ids):
+            if fid == face_id:
+                if replacement is None:
+                    self.last_seen[i] = -np.inf
+                else:
+                    self.ids[i] = replacement
+
+
+def stream_cache(stream_id):
+    """The StreamCache of stream_id, created on first use."""
+    cache = last_faces.get(stream_id)
+    if cache is None:
+        cache = last_faces.setdefault(stream_id, StreamCache())
+    return cache
+
+
+def drop_stream(stream_id, cache=None):
+    """Forget a finished stream's cache; with cache, only if it is still that one (not a successor's)."""
+    if cache is None or last_faces.get(stream_id) is cache:
+        last_faces.pop(stream_id, None)
+
+
+def _publish(now):
+    """Swap in a fresh snapshot once the current one is older than REGISTRY_SNAPSHOT_INTERVAL (caller holds lock)."""
+    global snapshot, _dirty, _published_at
+    if _dirty and now - _published_at >= config.REGISTRY_SNAPSHOT_INTERVAL:
+        snapshot = known_faces.snapshot()
+        _dirty = False
+        _published_at = now
+        registry_stats["snapshots"] += 1
+
+
+def _apply_pending():
+    """Fold queued snapshot hits into stats and centroids (caller holds lock)."""
+    global _dirty
+    while True:
+        try:
+            fid, emb, seen = _pending.get_nowait()
+        except queue.Empty:
+            return
+        _touch(fid, emb, seen)
+        _dirty = True
+
+
+def _touch(fid, emb, now):
+    """Count a registry hit and fold the embedding into the identity's running centroid."""
+    centroid = known_faces.get(fid)
+    if centroid is None:
+        return      # evicted or merged away since the snapshot it was matched in
+    st = face_stats.setdefault(fid, [0, _loaded_at, 1])
+    st[0] += 1
+    st[1] = max(st[1], now)
+    st[2] += 1      # hits also count cache hits, which add nothing to the centroid
+    n = min(st[2], config.REGISTRY_CENTROID_WINDOW)   # running mean over a bounded window
+    known_faces.update(fid, centroid + (emb - centroid) / n)
+    _changed.add(fid)
+
+def _forget(fid, replacement=None):
+    """Drop fid from the per-stream caches, or re-point its entries at replacement."""
+    for cache in list(last_faces.values()):
+        cache.forget(fid, replacement)
+
+def _evict_if_needed():
+    """Keep the registry within REGISTRY_CAPACITY, evicting a batch at a time (caller holds lock)."""
+    capacity = config.REGISTRY_CAPACITY
+    if not capacity or len(known_faces) <= capacity:
+        return
+    fids = known_faces.face_ids()
+    target = int(capacity * (1.0 - config.REGISTRY_EVICT_BATCH))
+    stats = [face_stats.get(fid, (0, _loaded_at, 1)) for fid in fids]
+    last = np.fromiter((st[1] for st in stats), dtype=np.float64, count=len(fids))
+    if config.REGISTRY_EVICTION == "lfu":
+        hits = np.fromiter((st[0] for st in stats), dtype=np.int64, count=len(fids))
+        order = np.lexsort((last, hits))        # fewest hits first, oldest first among ties
+    else:
+        order = np.argsort(last, kind="stable")  # least recently seen first
+    for i in order[:len(fids) - target]:
+        fid = fids[i]
+        known_faces.remove(fid)
+        face_stats.pop(fid, None)
+        _forget(fid)
+        registry_stats["evicted"] += 1
 
-    # 2. Cleanup expired cache
-    last_faces[stream_id] = [e for e in last_faces[stream_id] if now - e["last_seen"] < cache_ttl]
+def _merge(keep, drop):
+    """Fold identity drop into keep: sample-weighted centroid, summed stats (caller holds lock)."""
+    vk, vd = known_faces.get(keep), known_faces.get(drop)
+    hk, lk, sk = face_stats.get(keep, (0, _loaded_at, 1))
+    hd, ld, sd = face_stats.get(drop, (0, _loaded_at, 1))
+    known_faces.update(keep, (vk * sk + vd * sd) / (sk + sd))
+    known_faces.remove(drop)
+    face_stats[keep] = [hk + hd, max(lk, ld), sk + sd]
+    face_stats.pop(drop, None)
+    _changed.add(keep)
+    _forget(drop, replacement=keep)
+    registry_stats["merged"] += 1
 
-    # 3. Check global registry
+def consolidate(threshold=None, chunk=64, full=False):
+    """One pass merging identities whose centroids are within threshold of each other.
+
+    Only identities enrolled or moved since the last pass are compared with
+    the rest: a pair where neither changed was already compared, so a pass
+    costs O(changed * N) rather than O(N^2). Identities loaded from disk
+    count as consolidated; full=True compares everything. Works chunk by
+    chunk, taking the lock once per chunk so lookups are never stalled for a
+    whole pass. The identity with more hits survives. Returns the number of
+    merges.
+    """
+    global _dirty, _changed
+    threshold = config.REGISTRY_MERGE_THRESHOLD if threshold is None else threshold
     with lock:
-        for fid, stored_embed in known_faces.items():
-            dist = np.linalg.norm(emb - np.array(stored_embed))
-            if dist < threshold:
-                last_faces[stream_id].append({"face_id": fid, "embedding": emb, "last_seen": now})
-                return fid
-
-        # 4. New face
-        fid = f"person_{next_face_id}"
-        next_face_id += 1
-        known_faces[fid] = emb
-        last_faces[stream_id].append({"face_id": fid, "embedding": emb, "last_seen": now})
+        if full:
+            fids = known_faces.face_ids()
+            _changed = set()
+        else:
+            fids, _changed = sorted(_changed), set()
+    merged = 0
+    for start in range(0, len(fids), chunk):
+        with lock:
+            batch, vecs = [], []
+            for fid in fids[start:start + chunk]:
+                vec = known_faces.get(fid)
+                if vec is not None:
+                    batch.append(fid)
+                    vecs.append(vec)
+            if not batch:
+                continue
+            for fid, hits in zip(batch, known_faces.search_many(np.stack(vecs), k=2)):
+                if known_faces.get(fid) is None:
+                    continue    # merged away earlier in this chunk
+                for other, dist in hits:
+                    if other == fid or dist >= threshold or known_faces.get(other) is None:
+                        continue
+                    h_fid = face_stats.get(fid, (0,))[0]
+                    h_other = face_stats.get(other, (0,))[0]
+                    keep, drop = (fid, other) if h_fid >= h_other else (other, fid)
+                    _merge(keep, drop)
+                    merged += 1
+                    break
+        time.sleep(0)   # let waiting lookups in between chunks
+    registry_stats["consolidation_passes"] += 1
+    if merged:
+        with lock:
+            _dirty = True
+            _publish(time.time())
+    return merged
+
+def _consolidate_forever():
+    while True:
+        time.sleep(config.REGISTRY_CONSOLIDATE_INTERVAL)
+        try:
+            consolidate()
+            flush()
+        except Exception as e:
+            metrics.ERRORS.inc(where="consolidate", error=type(e).__name__)
+
+def start_consolidation():
+    """Start the background consolidation thread once (no-op if disabled)."""
+    global _consolidator
+    if _consolidator is None and config.REGISTRY_CONSOLIDATE_INTERVAL > 0 and not config.REGISTRY_SERVICE:
+        _consolidator = threading.Thread(target=_consolidate_forever, name="registry-consolidation",
+                                         daemon=True)
+        _consolidator.start()
+
+def service():
+    """Proxy to the registry service (multi-process mode), connected on first use."""
+    global _service
+    if _service is None:
+        from registry_service import connect
+        _service = connect(config.REGISTRY_SERVICE)
+    return _service
+
+def _drain_pending():
+    hits = []
+    while True:
+        try:
+            hits.append(_pending.get_nowait())
+        except queue.Empty:
+            return hits
+
+def record_hits(hits=()):
+    """Queue snapshot hits and apply them if the lock is free (or forward them to the service)."""
+    for hit in hits:
+        _pending.put(hit)
+    if config.REGISTRY_SERVICE:
+        hits = _drain_pending()
+        if hits:
+            service().record_hits(hits)
+    elif lock.acquire(blocking=False):
+        try:
+            _apply_pending()
+            _publish(time.time())
+        finally:
+            lock.release()
+
+def resolve(emb, threshold, now=None):
+    """Authoritative lookup-or-enrol against the live index, under the writer lock."""
+    global next_face_id, _dirty
+    now = time.time() if now is None else now
+    if config.REGISTRY_SERVICE:
+        return service().resolve(emb, threshold, now, _drain_pending())
+    with lock:
+        registry_stats["slow_path"] += 1
+        _apply_pending()
+        match = known_faces.search(emb, k=1)
+        if match and match[0][1] < threshold:
+            fid = match[0][0]
+            _touch(fid, emb, now)
+        else:
+            fid = f"person_{next_face_id}"
+            next_face_id += 1
+            known_faces.add(fid, emb)
+            face_stats[fid] = [1, now, 1]
+            _changed.add(fid)
+            _evict_if_needed()
+        _dirty = True
+        _publish(now)
+    return fid
+
+def get_face_id(embedding, stream_id, threshold=0.6, cache_ttl=5.0, cache=None):
+    """Compare embedding to cache + registry. Return stable face_id.
+
+    Hits in the stream's cache or the registry snapshot take no lock; only a
+    miss (a likely new face) does, re-checking the live index before enrolling.
+    """
+    if _consolidator is None:
+        start_consolidation()
+    now = time.time()
+    emb = np.asarray(embedding, dtype=np.float32).ravel()
+    if cache is None:
+        cache = stream_cache(stream_id)
+    cache.ttl = cache_ttl
+
+    # 1. Check per-stream recent cache
+    fid = cache.lookup(emb, now, threshold)
+    if fid is not None:
+        registry_stats["cache_hits"] += 1
+        st = face_stats.get(fid)
+        if st is not None:
+            st[0] += 1
+            st[1] = now
         return fid
+
+    # 2. Check the registry snapshot (nearest stored face within threshold)
+    match = snapshot.search(emb, k=1)
+    if match and match[0][1] < threshold:
+        fid = match[0][0]
+        registry_stats["snapshot_hits"] += 1
+        # Stats and centroid are updated by whoever next holds the lock
+        _pending.put((fid, emb, now))
+        if _pending.qsize() >= config.REGISTRY_PENDING_MAX:
+            record_hits()
+    else:
+        # 3. Miss: re-check the live index, it may have enrolled this face since the snapshot;
+        # 4. otherwise enrol it as a new face
+        fid = resolve(emb, threshold, now)
+    cache.insert(fid, emb, now)
+    return fid
+
+def flush():
+    """Persist registry metadata and compact the store if enough rows are tombstoned."""
+    if config.REGISTRY_SERVICE:
+        try:
+            record_hits()
+        except Exception:
+            pass    # service or proxy already torn down at exit; only hit counts are lost
+        return
+    if store is None:
+        return
+    with lock:
+        _apply_pending()
+        store.flush()
+        store.maybe_compact(config.REGISTRY_COMPACT_RATIO)
+
+atexit.register(flush)
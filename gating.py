@@ -0,0 +1,64 @@
+import time
+import cv2
+import numpy as np
+import config
+
+
+class MotionGate:
+    """Cheap scene-change pre-filter run before inference.
+
+    Each candidate frame is shrunk to a tiny grayscale thumbnail and compared
+    with the thumbnail of the last frame that was actually analysed. If fewer
+    than `threshold` (fraction of pixels) moved by more than `pixel_delta`
+    grey levels, inference is skipped. `max_skip` forces a refresh every so
+    often so identities and attributes never go stale on a static scene.
+    """
+
+    def __init__(self, threshold=None, pixel_delta=None, max_skip=None, size=(64, 48)):
+        self.threshold = config.MOTION_THRESHOLD if threshold is None else float(threshold)
+        self.pixel_delta = config.MOTION_PIXEL_DELTA if pixel_delta is None else int(pixel_delta)
+        self.max_skip = config.MOTION_MAX_SKIP if max_skip is None else float(max_skip)
+        if not 0 <= self.threshold <= 1:
+            raise ValueError(f"motion_threshold must be a fraction in [0, 1], got {self.threshold}")
+        if not 0 <= self.pixel_delta <= 255:
+            raise ValueError(f"motion_pixel_delta must be in [0, 255], got {self.pixel_delta}")
+        if self.max_skip < 0:
+            raise ValueError(f"motion_max_skip must not be negative, got {self.max_skip}")
+        self.size = size
+        self.analyzed = 0
+        self.skipped = 0
+        self._ref = None
+        self._ref_ts = 0.0
+
+    @classmethod
+    def from_options(cls, options):
+        """Build from the per-stream `streams` handshake entry."""
+        return cls(options.get("motion_threshold"), options.get("motion_pixel_delta"),
+                   options.get("motion_max_skip"))
+
+    def _thumb(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def should_analyze(self, frame):
+        """True if the frame differs enough from the last analysed one (or the gate is off)."""
+        if self.threshold <= 0:
+            self.analyzed += 1
+            return True
+        now = time.time()
+        thumb = self._thumb(frame)
+        if self._ref is not None and now - self._ref_ts < self.max_skip:
+            changed = np.count_nonzero(cv2.absdiff(thumb, self._ref) > self.pixel_delta)
+            if changed < self.threshold * thumb.size:
+                self.skipped += 1
+                return False
+        self._ref, self._ref_ts = thumb, now
+        self.analyzed += 1
+        return True
+
+    def reset(self):
+        """Forget the reference frame, e.g. when the frame it came from never got analysed."""
+        self._ref = None
+
+    def stats(self):
+        return {"analyzed": self.analyzed, "skipped": self.skipped}
@@ -0,0 +1,138 @@
+import time
+import threading
+import numpy as np
+import config
+from utils import parse_df_result
+
+ACTIONS = ["age", "gender", "emotion"]
+
+DeepFace = None     # imported by load_models(), so processes that never infer don't pay for it
+_load_lock = threading.Lock()
+_loaded = False
+
+def load_models():
+    """Import DeepFace (or stub_model) and build every configured model, once per process.
+
+    One dummy pass through detection, attributes and embedding leaves the
+    models in DeepFace's own cache. Concurrent callers wait for the first
+    one instead of each loading a copy.
+    """
+    global DeepFace, _loaded
+    if _loaded:
+        return
+    with _load_lock:
+        if _loaded:
+            return
+        if config.INFERENCE_BACKEND == "stub":
+            import stub_model as df
+        else:
+            from deepface import DeepFace as df
+        DeepFace = df
+        frame = np.full((240, 320, 3), 128, dtype=np.uint8)
+        detect_faces(frame)
+        crop = frame[:160, :160]
+        DeepFace.analyze(crop, actions=ACTIONS, enforce_detection=False, detector_backend="skip")
+        embed_face(crop)
+        _loaded = True
+
+def detect_faces(frame, detector_backend=None, roi=None, min_face=0, scale=1.0):
+    """Run face detection once. Return [(region, crop)] with BGR crops cut from frame.
+
+    roi is a list of (x0, y0, x1, y1) pixel boxes to search instead of the
+    whole frame. With scale != 1 the detector sees a resized copy; regions are
+    mapped back and crops always come from the full-resolution frame.
+    Faces whose shorter side is under min_face pixels are dropped.
+    """
+    fh, fw = frame.shape[:2]
+    out = []
+    for x0, y0, x1, y1 in roi or [(0, 0, fw, fh)]:
+        area_img = frame[y0:y1, x0:x1]
+        if area_img.size == 0:
+            continue
+        if scale != 1.0:
+            import cv2      # not at module level: importing the server must not load cv2
+            area_img = cv2.resize(area_img, None, fx=scale, fy=scale,
+                                  interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        sh, sw = area_img.shape[:2]
+        faces = DeepFace.extract_faces(area_img, detector_backend=detector_backend or config.DETECTOR_BACKEND,
+                                       enforce_detection=False, align=False)
+        for face in faces:
+            area = face["facial_area"]
+            # With enforce_detection=False DeepFace returns the whole image when nothing is found
+            if not face.get("confidence") and int(area["w"]) >= sw and int(area["h"]) >= sh:
+                continue
+            x = max(x0, x0 + int(area["x"] / scale))
+            y = max(y0, y0 + int(area["y"] / scale))
+            w = min(int(area["w"] / scale), x1 - x)
+            h = min(int(area["h"] / scale), y1 - y)
+            if w <= 0 or h <= 0 or min(w, h) < min_face:
+                continue
+            out.append(({"x": x, "y": y, "w": w, "h": h}, frame[y:y+h, x:x+w]))
+    return out
+
+def embed_face(crop):
+    """Embed an already-detected face crop."""
+    rep = DeepFace.represent(crop, model_name=config.EMBED_MODEL,
+                             enforce_detection=False, detector_backend="skip")
+    return (rep[0] if isinstance(rep, list) else rep)["embedding"]
+
+def _actions(embedding, known):
+    """Attribute actions a face still needs, given analyze_batch's `known` hints."""
+    if known is None:
+        return ACTIONS
+    diff = known["vecs"] - embedding
+    d2 = np.einsum("ij,ij->i", diff, diff)
+    i = int(np.argmin(d2))
+    return list(known["actions"][i]) if d2[i] < known["threshold"] ** 2 else ACTIONS
+
+def analyze_batch(frames, timings=None, params=None):
+    """Detect on every frame, then run embedding and attributes stage-wise over all crops.
+
+    Returns one face list per frame. This is the unit of work handed to the
+    scheduler's workers, so each model runs over the whole micro-batch in turn.
+    params, if given, holds one dict (or None) per frame: detect_faces keyword
+    arguments plus optional "known" attribute-cache hints (AttributeCache.hints);
+    attributes a hint says are cached come back as None.
+    If timings is a dict, the seconds spent per stage are added to it.
+    """
+    load_models()
+    params = [dict(p or {}) for p in params or [None] * len(frames)]
+    known = [p.pop("known", None) for p in params]
+    t0 = time.perf_counter()
+    detections = [detect_faces(frame, **p) for frame, p in zip(frames, params)]
+    crops = [(crop, hints) for faces, hints in zip(detections, known) for _, crop in faces]
+    t1 = time.perf_counter()
+    embeds = [np.asarray(embed_face(crop), dtype=np.float32) for crop, _ in crops]
+    t2 = time.perf_counter()
+    attrs = []
+    for (crop, hints), emb in zip(crops, embeds):
+        actions = _actions(emb, hints)
+        attrs.append(parse_df_result(DeepFace.analyze(crop, actions=actions, enforce_detection=False,
+                                                      detector_backend="skip"))
+                     if actions else (None, None, None, None))
+    if timings is not None:
+        t3 = time.perf_counter()
+        for stage, seconds in (("detect", t1 - t0), ("embed", t2 - t1), ("attributes", t3 - t2)):
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    results, i = [], 0
+    for faces in detections:
+        frame_results = []
+        for region, _ in faces:
+            age, gender, emotion, _ = attrs[i]
+            frame_results.append({
+                "region": region, "age": age, "gender": gender, "emotion": emotion,
+                "embedding": embeds[i],
+            })
+            i += 1
+        results.append(frame_results)
+    return results
+
+def analyze_batch_timed(frames, params=None):
+    """analyze_batch plus its per-stage timings; results cross the process boundary by value."""
+    timings = {}
+    return analyze_batch(frames, timings, params), timings
+
+def analyze_frame(frame):
+    """Detect once, then run embedding + attributes on the same face crops."""
+    return analyze_batch([frame])[0]
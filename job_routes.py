@@ -0,0 +1,59 @@
+import json, asyncio
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from batch_jobs import jobs
+
+def register_job_routes(app):
+    @app.post("/jobs")
+    def submit_job(body: dict):
+        """Start an offline job: {"path": file or directory, "sample_fps", "embeddings",
+        "output": file name under BATCH_OUTPUT_DIR}."""
+        if not body.get("path"):
+            raise HTTPException(status_code=400, detail="path is required")
+        try:
+            job = jobs.submit(body["path"], body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return job.stats()
+
+    @app.get("/jobs")
+    def list_jobs():
+        return jobs.stats()
+
+    @app.get("/jobs/{job_id}")
+    def job_status(job_id: str):
+        """Progress of one job; "output" is set once the .npz file is written."""
+        return _job(job_id).stats()
+
+    @app.delete("/jobs/{job_id}")
+    def cancel_job(job_id: str):
+        job = jobs.cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="unknown job")
+        return job.stats()
+
+    @app.get("/jobs/{job_id}/results")
+    async def job_results(job_id: str, start: int = 0):
+        """Faces found so far as NDJSON, one object per line, following the job until it ends."""
+        job = _job(job_id)
+
+        async def follow():
+            cursor = start
+            while True:
+                finished = job.done()
+                rows = job.results(cursor)
+                cursor += len(rows)
+                if rows:
+                    yield "".join(json.dumps(r) + "\n" for r in rows)
+                if finished:
+                    yield json.dumps({"type": "status", **job.stats()}) + "\n"
+                    return
+                await asyncio.sleep(0.5)
+
+        return StreamingResponse(follow(), media_type="application/x-ndjson")
+
+def _job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    return job
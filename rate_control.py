@@ -0,0 +1,76 @@
+import time
+import config
+
+
+def _number(name, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number, got {value!r}")
+    return float(value)
+
+
+class AdaptiveRate:
+    """Per-stream sampling-rate controller (AIMD) driven by inference latency and backlog.
+
+    After each analysed frame the stream reports how long inference took; the
+    controller also looks at the shared scheduler's backlog. Under pressure
+    the rate drops multiplicatively, harder for low-priority streams; when
+    there is headroom it climbs additively, faster for high-priority ones.
+    The rate always stays within the client-supplied [min_fps, max_fps].
+    """
+
+    def __init__(self, min_fps=None, max_fps=None, priority=None, backlog=None,
+                 target_latency=None, adjust_every=1.0):
+        self.max_fps = config.DEFAULT_MAX_FPS if max_fps is None else _number("max_fps", max_fps)
+        self.min_fps = config.DEFAULT_MIN_FPS if min_fps is None else _number("min_fps", min_fps)
+        if self.max_fps <= 0 or self.min_fps <= 0:
+            raise ValueError(f"min_fps and max_fps must be positive, got {self.min_fps} and {self.max_fps}")
+        if min_fps is None:
+            self.min_fps = min(self.min_fps, self.max_fps)
+        elif self.min_fps > self.max_fps:
+            raise ValueError(f"min_fps ({self.min_fps}) must not exceed max_fps ({self.max_fps})")
+        self.priority = 1.0 if priority is None else _number("priority", priority)
+        if self.priority <= 0:
+            raise ValueError(f"priority must be positive, got {self.priority}")
+        self.priority = max(self.priority, 0.1)
+        self.backlog = backlog or (lambda: 0.0)     # callable -> scheduler load in [0, 1]
+        self.target_latency = target_latency or config.RATE_TARGET_LATENCY_MS / 1000.0
+        self.adjust_every = adjust_every
+        self.fps = self.max_fps
+        self.latency = None                         # EWMA of per-frame inference latency (s)
+        self._last_adjust = time.monotonic()
+
+    @classmethod
+    def from_options(cls, options, backlog=None, max_fps=None):
+        """Build from the per-stream `streams` handshake entry (min_fps, max_fps, priority)."""
+        return cls(options.get("min_fps"), options.get("max_fps", max_fps),
+                   options.get("priority"), backlog=backlog)
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps
+
+    def observe(self, latency=None):
+        """Record one frame's inference latency (None if it was rejected) and maybe adjust the rate.
+
+        Adjustments happen at most once every adjust_every seconds.
+        """
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        now = time.monotonic()
+        if now - self._last_adjust < self.adjust_every:
+            return
+        self._last_adjust = now
+        load = self.backlog()
+        latency = self.latency or 0.0
+        if load > 0.5 or latency > self.target_latency:
+            self.fps *= max(0.5, 1.0 - 0.25 / self.priority)
+        elif load < 0.1 and latency < 0.5 * self.target_latency:
+            self.fps += 0.25 * self.priority
+        self.fps = min(self.max_fps, max(self.min_fps, self.fps))
+
+    def stats(self):
+        return {
+            "effective_fps": round(self.fps, 2), "min_fps": self.min_fps, "max_fps": self.max_fps,
+            "priority": self.priority,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+        }
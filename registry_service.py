@@ -0,0 +1,148 @@
+"""Shared face registry for running the server as several processes.
+
+One process owns the registry and is the only one that enrols faces, so
+person_N ids stay unique; every uvicorn worker is a client
+(config.REGISTRY_SERVICE = "host:port"). Clients keep their per-stream
+caches, search the service's registry directory read-only through the
+shared page cache (registry_store maps), and only call the service for a
+miss, which enrols or matches under the service's lock, and for batches of
+hit statistics.
+
+    python registry_service.py --workers 4 [--host 0.0.0.0] [--port 8000]
+
+starts the service and then uvicorn with that many worker processes. The
+kernel spreads incoming connections over the workers, so streams are
+sharded by socket; each worker has its own inference pool. Without
+REGISTRY_DIR the launcher uses a temporary directory, removed on exit.
+
+The service speaks pickle, so the authkey is all that stands between a
+client and code execution in the service. Unless REGISTRY_AUTHKEY is set,
+the launcher generates a random one per run and hands it to the service and
+the workers through the environment; a service on a non-loopback address
+refuses to start with a short key.
+"""
+import os
+import sys
+import time
+import socket
+import signal
+import ipaddress
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from multiprocessing.managers import BaseManager
+import numpy as np
+import config
+
+
+class RegistryService:
+    """What clients can call; runs face_registry in its ordinary single-process mode."""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def resolve(self, embedding, threshold, now, hits):
+        self.registry.record_hits(hits)
+        return self.registry.resolve(np.asarray(embedding, dtype=np.float32), threshold, now)
+
+    def record_hits(self, hits):
+        self.registry.record_hits(hits)
+
+    def stats(self):
+        return {"identities": len(self.registry.known_faces), **self.registry.registry_stats}
+
+
+class _ServiceManager(BaseManager):
+    pass
+
+
+class _ClientManager(BaseManager):
+    pass
+
+
+_ClientManager.register("registry")
+
+
+def _address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def _authkey(address):
+    """The configured authkey, refusing keys too weak for where the service listens."""
+    key = config.REGISTRY_AUTHKEY
+    if not key:
+        raise RuntimeError("REGISTRY_AUTHKEY is not set; start the service with registry_service.py "
+                           "or give every process the same secret")
+    host = _address(address)[0]
+    if len(key) < 16 and not ipaddress.ip_address(socket.gethostbyname(host)).is_loopback:
+        raise RuntimeError(f"refusing to serve the registry on {host} with a REGISTRY_AUTHKEY "
+                           f"shorter than 16 bytes")
+    return key
+
+
+def connect(address, timeout=10.0):
+    """Proxy to the RegistryService at "host:port", retrying while it starts up."""
+    deadline = time.monotonic() + timeout
+    while True:
+        manager = _ClientManager(address=_address(address), authkey=_authkey(address))
+        try:
+            manager.connect()
+            return manager.registry()
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def serve(address):
+    """Run the registry service at "host:port" until terminated."""
+    config.REGISTRY_SERVICE = ""    # this process owns the registry
+    import face_registry
+    service = RegistryService(face_registry)
+    _ServiceManager.register("registry", callable=lambda: service)
+    server = _ServiceManager(address=_address(address), authkey=_authkey(address)).get_server()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    face_registry.start_consolidation()
+    try:
+        server.serve_forever()
+    finally:
+        # Not left to atexit: forked children exit without running it
+        face_registry.flush()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--registry", default="127.0.0.1:50555", help="host:port of the registry service")
+    args = ap.parse_args()
+
+    import uvicorn
+    if not config.REGISTRY_AUTHKEY:
+        # Inherited by the spawned service and the uvicorn workers
+        os.environ["REGISTRY_AUTHKEY"] = os.urandom(32).hex()
+        config.REGISTRY_AUTHKEY = os.environ["REGISTRY_AUTHKEY"].encode()
+    _authkey(args.registry)     # fail here, not in the service process
+    tmp = None
+    if not config.REGISTRY_DIR:
+        tmp = tempfile.mkdtemp(prefix="registry-")
+        os.environ["REGISTRY_DIR"] = config.REGISTRY_DIR = tmp
+    service = multiprocessing.get_context("spawn").Process(target=serve, args=(args.registry,),
+                                                           name="registry-service")
+    service.start()
+    try:
+        connect(args.registry)      # wait until it accepts connections
+        os.environ["REGISTRY_SERVICE"] = args.registry
+        uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        service.terminate()
+        service.join(timeout=10)
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
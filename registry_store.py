@@ -0,0 +1,401 @@
+"""Persistent, memory-mapped face registry.
+
+A registry directory holds three append-only column files plus a small
+meta file:
+
+    embeddings.f32   float32 rows of `dim` values
+    norms.f32        float32 ||embedding||^2 per row
+    ids.i64          int64 N of "person_N" per row; negated when the row is deleted
+    meta.json        {"version", "dim", "next_face_id", "generation"}
+
+Rows are committed by the write to ids.i64, which always comes last, so a
+reader never sees a row whose embedding is not on disk yet. Rows are written
+at the offset given by the ids file, so what a torn append left behind in
+the other two files is overwritten by the next one. Opening maps the
+files without reading them, so load time does not depend on registry size,
+and any number of processes can map the same directory read-only;
+refresh() picks up rows appended (or a compaction done) by the writer.
+
+The column files of generation 0 sit in the directory itself, those of
+generation G in its genG/ subdirectory. Compaction writes a complete new
+generation and then switches meta.json to it, one atomic rename, so a
+reader always maps the three files of a single generation.
+
+Within the writing process, `view` is the (count, ids, vecs, sq_norms) tuple
+of the current maps, replaced as a whole on every re-map. Searches take it
+once, so they need no lock: rows below count are never moved, a tombstone is
+a single int64 store, and a compaction maps new files while the old maps stay
+valid for whoever still holds them.
+"""
+import os
+import json
+import shutil
+import threading
+import numpy as np
+import config
+from face_index import FaceIndex, make_index, top_k
+
+VERSION = 1
+
+
+def face_number(face_id):
+    """Numeric part of a face id: "person_17" -> 17."""
+    return int(str(face_id).rsplit("_", 1)[-1])
+
+
+class RegistryStore:
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.dim = None
+        self.next_face_id = 1
+        self.generation = 0
+        self.count = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vecs = np.empty((0, 0), dtype=np.float32)
+        self.sq_norms = np.empty(0, dtype=np.float32)
+        self._meta_inode = None
+        self._mapped = None         # generation of the current maps
+        self._rows = None           # person number -> row, built on first use
+        self._rows_lock = threading.RLock()     # row_of also runs from lock-free searches (refiner)
+        self.live_count = 0
+        self.view = (0, self.ids, self.vecs, self.sq_norms)
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+        self._load_meta()
+        self._map()
+        if self.count:
+            self.next_face_id = max(self.next_face_id, int(np.abs(self.ids).max()) + 1)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _gen_dir(self, generation):
+        return self.path if generation == 0 else os.path.join(self.path, f"gen{generation}")
+
+    def _col(self, name, generation=None):
+        """Path of a column file in a generation (default: the current one)."""
+        return os.path.join(self._gen_dir(self.generation if generation is None else generation), name)
+
+    def _load_meta(self):
+        try:
+            with open(self._file("meta.json")) as f:
+                self._meta_inode = os.fstat(f.fileno()).st_ino
+                meta = json.load(f)
+        except FileNotFoundError:
+            return
+        if meta.get("version") != VERSION:
+            raise ValueError(f"unsupported registry version in {self.path}: {meta.get('version')}")
+        self.dim = meta.get("dim")
+        self.next_face_id = meta.get("next_face_id", 1)
+        self.generation = meta.get("generation", 0)
+
+    def _write_meta(self):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"version": VERSION, "dim": self.dim, "next_face_id": self.next_face_id,
+                       "generation": self.generation}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._file("meta.json"))
+
+    def _map(self):
+        """(Re)map the current generation's column files; count is bounded by the ids file.
+
+        Returns True if live_count was recomputed from the files.
+        """
+        with self._rows_lock:
+            try:
+                return self._map_generation()
+            except FileNotFoundError:
+                if not self.readonly:
+                    raise
+                # The writer compacted and removed this generation after we read meta.json
+                self._load_meta()
+                return self._map_generation()
+
+    def _map_generation(self):
+        ids_path = self._col("ids.i64")
+        if self.dim is None or not os.path.exists(ids_path):
+            return False
+        count = os.stat(ids_path).st_size // 8
+        recount = self.readonly or self.generation != self._mapped
+        if self.generation != self._mapped:
+            self._rows = None       # compacted: row numbers changed
+        if not count:
+            self.ids = np.empty(0, dtype=np.int64)
+            self.vecs = np.empty((0, self.dim), dtype=np.float32)
+            self.sq_norms = np.empty(0, dtype=np.float32)
+        else:
+            mode = "r" if self.readonly else "r+"
+            self.ids = np.memmap(ids_path, dtype=np.int64, mode=mode, shape=(count,))
+            self.vecs = np.memmap(self._col("embeddings.f32"), dtype=np.float32, mode=mode,
+                                  shape=(count, self.dim))
+            self.sq_norms = np.memmap(self._col("norms.f32"), dtype=np.float32, mode=mode, shape=(count,))
+        self._mapped = self.generation
+        self.count = count
+        self.view = (count, self.ids, self.vecs, self.sq_norms)
+        if recount:
+            self.live_count = int(np.count_nonzero(self.ids > 0)) if count else 0
+        return recount
+
+    def refresh(self):
+        """Re-map if the writer appended rows or switched to a compacted generation."""
+        try:
+            if os.stat(self._file("meta.json")).st_ino != self._meta_inode:
+                self._load_meta()
+            st = os.stat(self._col("ids.i64"))
+        except FileNotFoundError:
+            return
+        if self.generation != self._mapped or st.st_size // 8 != self.count:
+            self._map()
+
+    def append(self, face_id, embedding):
+        """Append one row; returns its row index."""
+        emb = np.asarray(embedding, dtype=np.float32).ravel()
+        if self.dim is None:
+            self.dim = emb.shape[0]
+        num = face_number(face_id)
+        self.next_face_id = max(self.next_face_id, num + 1)
+        row = self.count
+        # At the row's offset, not the end of the file: a torn append may have left a longer tail
+        self._write_row("embeddings.f32", row * self.dim * 4, emb.tobytes())
+        self._write_row("norms.f32", row * 4, np.float32(emb @ emb).tobytes())
+        self._write_row("ids.i64", row * 8, np.int64(num).tobytes())
+        if self.count == 0:
+            self._write_meta()
+        with self._rows_lock:
+            if not self._map():
+                self.live_count += 1
+            if self._rows is not None:
+                self._rows[num] = self.count - 1
+            return self.count - 1
+
+    def _write_row(self, name, offset, data):
+        """Write one row at offset and cut the file there, dropping rows of an append that never committed."""
+        fd = os.open(self._col(name), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, data, offset)
+            os.ftruncate(fd, offset + len(data))
+        finally:
+            os.close(fd)
+
+    def row_of(self, face_id):
+        """Row holding face_id, or None if it is absent or deleted."""
+        with self._rows_lock:
+            # Built and replaced under the lock, so a map built from an older view never wins
+            if self._rows is None:
+                live = np.flatnonzero(self.live()) if self.count else []
+                self._rows = {int(self.ids[r]): int(r) for r in live}
+            return self._rows.get(face_number(face_id))
+
+    def update(self, row, embedding):
+        """Overwrite a row in place (centroid refresh); the row keeps its id."""
+        if row is None:
+            raise KeyError("no row to update")    # vecs[None] = ... would write every row
+        emb = np.asarray(embedding, dtype=np.float32).ravel()
+        self.vecs[row] = emb
+        self.sq_norms[row] = emb @ emb
+
+    def delete(self, row):
+        """Tombstone a row in place; it is dropped for good by the next compact()."""
+        with self._rows_lock:
+            if self.ids[row] > 0:
+                if self._rows is not None:
+                    self._rows.pop(int(self.ids[row]), None)
+                self.ids[row] = -self.ids[row]
+                self.live_count -= 1
+
+    def live(self):
+        return self.ids > 0
+
+    def compact(self):
+        """Write the live rows as a new generation, switch meta.json to it and drop the old one."""
+        keep = np.flatnonzero(self.live())
+        old, new = self.generation, self.generation + 1
+        os.makedirs(self._gen_dir(new), exist_ok=True)
+        for name, col in (("embeddings.f32", self.vecs), ("norms.f32", self.sq_norms),
+                          ("ids.i64", self.ids)):
+            with open(self._col(name, new), "wb") as f:
+                f.write(np.ascontiguousarray(col[keep]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.generation = new
+        self._write_meta()      # the switch: readers follow meta.json, never a half-written generation
+        self._map()
+        # Processes still mapping the old files keep them until they unmap
+        if old == 0:
+            for name in ("embeddings.f32", "norms.f32", "ids.i64"):
+                os.remove(self._col(name, 0))
+        else:
+            shutil.rmtree(self._gen_dir(old), ignore_errors=True)
+
+    def dead_ratio(self):
+        return float(np.count_nonzero(self.ids <= 0)) / self.count if self.count else 0.0
+
+    def maybe_compact(self, max_dead=0.2):
+        """Compact once more than max_dead of the rows are tombstones."""
+        if not self.readonly and self.dead_ratio() > max_dead:
+            self.compact()
+            return True
+        return False
+
+    def flush(self):
+        """Persist next_face_id and any in-place tombstones or centroid updates."""
+        if isinstance(self.ids, np.memmap) and not self.readonly:
+            self.ids.flush()
+            self.vecs.flush()
+            self.sq_norms.flush()
+        if not self.readonly and self.dim is not None:
+            self._write_meta()
+
+
+class MappedIndex(FaceIndex):
+    """Exact search straight over a RegistryStore's memory maps; nothing is copied at load.
+
+    Searches read the store's `view`, so the index is its own snapshot.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    @property
+    def size(self):
+        return self.store.live_count
+
+    def add(self, face_id, embedding):
+        if self.store.readonly:
+            raise RuntimeError("registry store is opened read-only")
+        self.store.append(face_id, embedding)
+
+    def search(self, embedding, k=1):
+        store = self.store
+        if store.readonly:
+            store.refresh()
+        n, ids, vecs, sq_norms = store.view
+        if not n:
+            return []
+        q = np.asarray(embedding, dtype=np.float32).ravel()
+        d2 = sq_norms[:n] - 2.0 * (vecs[:n] @ q) + (q @ q)
+        d2[ids[:n] <= 0] = np.inf
+        np.maximum(d2, 0.0, out=d2)
+        idx = top_k(d2, k)
+        return [(f"person_{int(ids[i])}", float(np.sqrt(d2[i]))) for i in idx
+                if np.isfinite(d2[i])]
+
+    def search_many(self, embeddings, k=1):
+        n, ids, vecs, sq_norms = self.store.view
+        if not n:
+            return [[] for _ in embeddings]
+        qs = np.asarray(embeddings, dtype=np.float32)
+        d2 = sq_norms[:n] - 2.0 * (qs @ vecs[:n].T) + np.einsum("ij,ij->i", qs, qs)[:, None]
+        d2[:, ids[:n] <= 0] = np.inf
+        np.maximum(d2, 0.0, out=d2)
+        out = []
+        for row in d2:
+            idx = top_k(row, k)
+            out.append([(f"person_{int(ids[i])}", float(np.sqrt(row[i]))) for i in idx
+                        if np.isfinite(row[i])])
+        return out
+
+    def get(self, face_id):
+        row = self.store.row_of(face_id)
+        return None if row is None else np.array(self.store.vecs[row])
+
+    def update(self, face_id, embedding):
+        row = self.store.row_of(face_id)
+        if row is None:
+            raise KeyError(face_id)
+        self.store.update(row, embedding)
+
+    def remove(self, face_id):
+        row = self.store.row_of(face_id)
+        if row is None:
+            return False
+        self.store.delete(row)
+        return True
+
+    def face_ids(self):
+        n, ids = self.store.view[:2]
+        return [f"person_{int(i)}" for i in ids[:n] if i > 0] if n else []
+
+    def snapshot(self):
+        return self
+
+
+class PersistedIndex(FaceIndex):
+    """Wraps an in-memory index (e.g. IVFIndex) so every insert is also appended to a store."""
+
+    def __init__(self, inner, store):
+        self.inner = inner
+        self.store = store
+        live = np.flatnonzero(store.live()) if store.count else []
+        for row in live:
+            inner.add(f"person_{int(store.ids[row])}", store.vecs[row])
+
+    @property
+    def size(self):
+        return len(self.inner)
+
+    def add(self, face_id, embedding):
+        self.inner.add(face_id, embedding)
+        self.store.append(face_id, embedding)
+
+    def search(self, embedding, k=1):
+        return self.inner.search(embedding, k)
+
+    def search_many(self, embeddings, k=1):
+        return self.inner.search_many(embeddings, k)
+
+    def get(self, face_id):
+        return self.inner.get(face_id)
+
+    def update(self, face_id, embedding):
+        row = self.store.row_of(face_id)
+        if row is None:
+            raise KeyError(face_id)
+        self.inner.update(face_id, embedding)
+        self.store.update(row, embedding)
+
+    def remove(self, face_id):
+        if not self.inner.remove(face_id):
+            return False
+        row = self.store.row_of(face_id)
+        if row is not None:
+            self.store.delete(row)
+        return True
+
+    def face_ids(self):
+        return self.inner.face_ids()
+
+    def snapshot(self):
+        return self.inner.snapshot()
+
+
+def refiner(store):
+    """face_ids -> full-precision rows read from the store's maps (None where a row is gone).
+
+    Lets a quantized index re-rank on the float32 files without keeping them in memory.
+    """
+    def refine(face_ids):
+        rows = []
+        n, ids, vecs, _ = store.view
+        for fid in face_ids:
+            num = face_number(fid)
+            row = store.row_of(fid)
+            # The row map may belong to a newer mapping than the view taken above
+            rows.append(np.array(vecs[row]) if row is not None and row < n and ids[row] == num else None)
+        return rows
+    return refine
+
+
+def open_index(store, backend=None, precision=None):
+    """Registry index over a store: exact float32 search maps the files directly, others load them.
+
+    Quantized indexes keep only their codes in memory and re-rank against the files.
+    """
+    backend = backend or config.FACE_INDEX_BACKEND
+    precision = precision or config.FACE_INDEX_PRECISION
+    if backend == "exact" and precision == "float32":
+        return MappedIndex(store)
+    return PersistedIndex(make_index(backend, precision, refine=refiner(store)), store)
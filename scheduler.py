@@ -0,0 +1,219 @@
+import time
+import queue
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import config
+import inference
+import metrics
+
+
+class InferenceScheduler:
+    """Central micro-batching scheduler shared by every stream.
+
+    Stream threads submit frames into one bounded queue. A collector thread
+    groups them into micro-batches (up to max_batch frames or max_wait
+    seconds after the first one) and hands each batch to a worker pool that
+    runs inference.analyze_batch. Every submitted frame gets its own Future,
+    resolved with that frame's face list, so results go back to the stream
+    (and socket) that produced them.
+    """
+
+    def __init__(self, workers=None, max_batch=None, max_wait=None, queue_size=None,
+                 use_processes=None):
+        self.workers = workers or config.INFERENCE_WORKERS
+        self.max_batch = max_batch or config.INFERENCE_MAX_BATCH
+        self.max_wait = max_wait if max_wait is not None else config.INFERENCE_MAX_WAIT_MS / 1000.0
+        self.use_processes = config.INFERENCE_PROCESSES if use_processes is None else use_processes
+        self._queue = queue.Queue(maxsize=queue_size or config.INFERENCE_QUEUE_SIZE)
+        self._slots = threading.BoundedSemaphore(self.workers)   # batches in flight
+        self._executor = None
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.ready = threading.Event()      # set once every worker has its models loaded
+        self.warmup_seconds = None
+        self.warmup_error = None
+        self._closed = False
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.use_processes:
+            ctx = multiprocessing.get_context(config.INFERENCE_START_METHOD)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                                 initializer=inference.load_models)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._thread = threading.Thread(target=self._collect, name="inference-scheduler", daemon=True)
+        self._thread.start()
+
+    def warm_up(self):
+        """Load the models in every worker before the first frame arrives; sets `ready`.
+
+        Worker processes load them in their initializer, so submitting one job
+        per worker just makes sure all of them are started. Thread workers
+        share the models of this process.
+        """
+        self.start()
+        start = time.monotonic()
+        try:
+            jobs = [self._executor.submit(inference.load_models) for _ in range(self.workers)]
+            for job in jobs:
+                job.result()
+        except Exception as e:
+            self.warmup_error = repr(e)
+            raise
+        self.warmup_seconds = time.monotonic() - start
+        self.ready.set()
+
+    def submit(self, stream_id, frame, block=False, timeout=None, params=None):
+        """Queue one frame. Returns a Future, or None if the queue is full.
+
+        Live streams never block; offline jobs pass block=True to wait for room.
+        params are the frame's detection settings (DetectionSettings.params).
+        """
+        fut = Future()
+        if self._closed:
+            fut.set_exception(_shut_down())
+            return fut
+        try:
+            self._queue.put((stream_id, frame, params, fut), block=block, timeout=timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return None
+        with self._stats_lock:
+            self.submitted += 1
+        return fut
+
+    def _collect(self):
+        while True:
+            self._slots.acquire()
+            item = self._queue.get()
+            if item is None:
+                self._slots.release()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)   # let the outer loop see the shutdown marker
+                    break
+                batch.append(item)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        with self._stats_lock:
+            self._batch_sizes[len(batch)] += 1
+            self.in_flight += len(batch)
+        try:
+            frames = [frame for _, frame, _, _ in batch]
+            params = [p for _, _, p, _ in batch]
+            job = self._executor.submit(inference.analyze_batch_timed, frames,
+                                        params if any(params) else None)
+        except Exception as e:
+            self._route(batch, None, e)
+            return
+        job.add_done_callback(lambda j: self._route(batch, j, None))
+
+    def _route(self, batch, job, error):
+        self._slots.release()
+        if error is None:
+            # Cancelled by shutdown(cancel_futures=True): exception() would raise CancelledError here
+            error = _shut_down() if job.cancelled() else job.exception()
+        with self._stats_lock:
+            self.in_flight -= len(batch)
+            if error is None:
+                self.completed += len(batch)
+            else:
+                self.failed += len(batch)
+        if error is not None:
+            metrics.ERRORS.inc(where="inference", error=type(error).__name__)
+            for *_, fut in batch:
+                fut.set_exception(error)
+            return
+        results, timings = job.result()
+        for stage, seconds in timings.items():
+            metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+        for (*_, fut), faces in zip(batch, results):
+            fut.set_result(faces)
+
+    def backlog(self):
+        """Queue fill ratio in [0, 1], the load signal used by rate_control."""
+        return self._queue.qsize() / self._queue.maxsize
+
+    def stats(self):
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            frames = sum(size * n for size, n in self._batch_sizes.items())
+            return {
+                "ready": self.ready.is_set(),
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "batches": batches,
+                "mean_batch_size": frames / batches if batches else 0.0,
+                "batch_sizes": {str(size): n for size, n in sorted(self._batch_sizes.items())},
+            }
+
+    def shutdown(self):
+        """Stop the collector and the workers; every frame not yet analysed fails, none is left waiting."""
+        if self._thread is None:
+            return
+        self._closed = True
+        self._fail_queued()
+        try:
+            self._queue.put(None, timeout=1)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._fail_queued()
+        self._thread = None
+
+    def _fail_queued(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                with self._stats_lock:
+                    self.failed += 1
+                item[-1].set_exception(_shut_down())
+
+
+def _shut_down():
+    return RuntimeError("inference scheduler is shut down")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Process-wide scheduler, started on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = InferenceScheduler()
+            _scheduler.start()
+        return _scheduler
@@ -1,10 +1,128 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+import config
+import metrics
+import face_registry
+from attributes import attribute_cache
 from ws_routes import register_ws_routes
-
-app = FastAPI()
+from job_routes import register_job_routes
+from scheduler import get_scheduler
+from connection import connections
+from stream_manager import manager
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start the inference workers and load every model once, off the event loop."""
+    scheduler = get_scheduler()
+    if config.REGISTRY_SERVICE:
+        face_registry.service()     # fail at startup, not on the first unknown face
+    if config.WARMUP_MODELS:
+        # Not awaited: the server accepts connections meanwhile and /ready reports progress
+        app.state.warmup = asyncio.get_running_loop().run_in_executor(None, scheduler.warm_up)
+    else:
+        scheduler.ready.set()
+    yield
+    manager.shutdown()      # pipelines first: they may be waiting on the scheduler
+    scheduler.shutdown()
+    face_registry.flush()
+
+app = FastAPI(lifespan=lifespan)
 
 # Register WebSocket endpoints
 register_ws_routes(app)
+register_job_routes(app)
+
+@app.get("/scheduler")
+def scheduler_stats():
+    """Inference queue depth and batch-size statistics."""
+    return get_scheduler().stats()
+
+@app.get("/ready")
+def ready():
+    """200 once every inference worker has its models loaded, 503 until then."""
+    scheduler = get_scheduler()
+    if not scheduler.ready.is_set():
+        raise HTTPException(status_code=503, detail=scheduler.warmup_error or "warming up")
+    return {"status": "ready", "warmup_seconds": scheduler.warmup_seconds}
+
+@app.get("/connections")
+def connection_stats():
+    """Outbound queue depth and sent/dropped counters per open websocket."""
+    return [conn.stats() for conn in list(connections)]
+
+@app.get("/streams")
+def stream_stats():
+    """Running pipelines, one per source URL, with their rates and counters."""
+    return manager.stats()
+
+@app.get("/metrics")
+def metrics_text():
+    """Everything above in the Prometheus text format, plus per-stage latency histograms."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@metrics.collector
+def _scheduler_metrics():
+    s = get_scheduler().stats()
+    return [
+        ("deepface_scheduler_ready", "gauge", "1 once models are loaded", [({}, int(s["ready"]))]),
+        ("deepface_scheduler_queue_depth", "gauge", "Frames waiting for inference", [({}, s["queue_depth"])]),
+        ("deepface_scheduler_in_flight", "gauge", "Frames submitted and not yet completed",
+         [({}, s["in_flight"])]),
+        ("deepface_scheduler_frames_total", "counter", "Frames by scheduler outcome",
+         [({"outcome": k}, s[k]) for k in ("submitted", "rejected", "completed")]),
+    ]
+
+@metrics.collector
+def _registry_metrics():
+    stats = face_registry.registry_stats
+    return [
+        ("deepface_registry_identities", "gauge", "Identities in this process's registry view",
+         [({}, len(face_registry.known_faces))]),
+        ("deepface_registry_lookups_total", "counter", "get_face_id lookups by where they were answered",
+         [({"result": "cache"}, stats["cache_hits"]), ({"result": "snapshot"}, stats["snapshot_hits"]),
+          ({"result": "slow_path"}, stats["slow_path"])]),
+        ("deepface_registry_evicted_total", "counter", "Identities evicted at capacity",
+         [({}, stats["evicted"])]),
+        ("deepface_registry_merged_total", "counter", "Duplicate identities merged",
+         [({}, stats["merged"])]),
+    ]
+
+@metrics.collector
+def _attribute_metrics():
+    counts = dict(attribute_cache.counts)
+    return [
+        ("deepface_attribute_faces_total", "counter",
+         "Faces whose age/gender or emotion was computed vs served from the attribute cache",
+         [({"attribute": attr, "result": result}, n) for (attr, result), n in counts.items()]),
+    ]
+
+@metrics.collector
+def _connection_metrics():
+    conns = [(str(conn.id), conn.stats()) for conn in list(connections)]
+    return [
+        ("deepface_connection_queue_depth", "gauge", "Payloads waiting in each websocket's outbox",
+         [({"connection": i}, s["depth"]) for i, s in conns]),
+        ("deepface_connection_dropped_total", "counter", "Payloads dropped by the backpressure policy",
+         [({"connection": i}, s["dropped"]) for i, s in conns]),
+    ]
+
+@metrics.collector
+def _stream_metrics():
+    streams = [(p.key, p.stats()) for p in manager.pipelines()]
+    return [
+        ("deepface_stream_target_fps", "gauge", "Analysis rate chosen by adaptive rate control",
+         [({"stream": url}, s.get("effective_fps")) for url, s in streams]),
+        ("deepface_stream_achieved_fps", "gauge", "Frames actually analysed per second, last status interval",
+         [({"stream": url}, s["fps_achieved"]) for url, s in streams]),
+        ("deepface_stream_dropped_frames", "gauge", "Frames decoded but never analysed",
+         [({"stream": url}, s.get("dropped_frames")) for url, s in streams]),
+        ("deepface_stream_subscribers", "gauge", "Websocket subscribers per source",
+         [({"stream": url}, s["subscribers"]) for url, s in streams]),
+        ("deepface_stream_threads", "gauge", "Pipeline threads: running, stopping, or stuck past STREAM_JOIN_TIMEOUT",
+         [({"state": state}, n) for state, n in manager.threads().items()]),
+    ]
 
 
 
@@ -1,95 +1,224 @@
-import cv2, time, threading
+import os
+import cv2, time
+import config
+import metrics
 from datetime import datetime
-from deepface import DeepFace
-from utils import threadsafe_send, parse_df_result
-from face_registry import get_face_id
+from scheduler import get_scheduler
+from face_registry import get_face_id, stream_cache, drop_stream
+from tracker import FaceTracker
+from capture import FrameReader, open_source
+from gating import MotionGate
+from detection import DetectionSettings
+from attributes import attribute_cache
+from rate_control import AdaptiveRate
 
-active_streams = {}
-video_caps = {}
+def _connect(pipeline, url, size, live, retry=False):
+    """Open url; live sources are retried with exponential backoff while the pipeline runs.
 
-def analyze_stream(stream_id: str, url: str, websocket, loop, max_fps=3):
-    """Grab frames → DeepFace.analyze → send JSON results."""
-    cap = cv2.VideoCapture(0 if url == "webcam" else url)
-    video_caps[stream_id] = cap
+    Returns the opened capture, or None once STREAM_RECONNECT_ATTEMPTS are used
+    up or the pipeline is stopped while waiting. retry=True skips the
+    immediate first attempt (the source just dropped).
+    """
+    delay = config.STREAM_RECONNECT_DELAY
+    attempts = config.STREAM_RECONNECT_ATTEMPTS if live else 0
+    for attempt in range(int(retry), attempts + 1):
+        if attempt:
+            pipeline.send({
+                "type": "status", "status": "reconnecting", "attempt": attempt, "retry_in": delay,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+            if pipeline.wait(delay):
+                return None
+            delay = min(2 * delay, config.STREAM_RECONNECT_MAX_DELAY)
+        cap = open_source(url, size)
+        if cap.isOpened():
+            return cap
+        cap.release()
+        if not pipeline.is_active():
+            return None
+    return None
 
-    if not cap.isOpened():
-        threadsafe_send(loop, websocket, {
-            "stream_id": stream_id, "type": "error",
-            "error": "cannot_open_stream", "url": url,
+def analyze_stream(pipeline, max_fps=None):
+    """Grab frames → motion gate → shared inference scheduler → broadcast results.
+
+    Runs on the pipeline's thread until the source ends or pipeline.stop() is
+    called. Payloads are sent without a stream_id; pipeline.send() fills in
+    each subscriber's own id. `pipeline.options` is the first subscriber's
+    entry from the `streams` handshake; it may carry
+    min_fps / max_fps / priority for the adaptive rate controller,
+    motion_threshold / motion_pixel_delta / motion_max_skip and on_static
+    ("resend" the previous analysis or "suppress" it while the scene is static),
+    realtime (pace recorded files at their own frame rate; on by default), and
+    roi / min_face / detect_scale / two_stage (see detection.DetectionSettings).
+    Network sources that fail to open or drop are reopened with backoff
+    (STREAM_RECONNECT_*); every exit path releases the decoder and the stream's
+    registry cache.
+    """
+    stream_key, url, options = pipeline.key, pipeline.url, pipeline.options
+    scheduler = get_scheduler()
+    on_static = options.get("on_static", config.ON_STATIC)
+    try:
+        # Every option is checked before the source is opened, so bad ones never leave state behind
+        detection = DetectionSettings.from_options(options)
+        gate = MotionGate.from_options(options)
+        rate = AdaptiveRate.from_options(options, backlog=scheduler.backlog, max_fps=max_fps)
+        if on_static not in ("resend", "suppress"):
+            raise ValueError(f"on_static must be \"resend\" or \"suppress\", got {on_static!r}")
+    except (TypeError, ValueError) as e:
+        pipeline.send({
+            "type": "error", "error": "invalid_options", "message": str(e), "url": url,
             "timestamp": datetime.utcnow().isoformat()
         })
         return
+    live = "://" in url and not url.startswith("file://")    # network source: reconnect if it drops
+    cap = _connect(pipeline, url, detection.capture_size, live)
+    if cap is None:
+        if pipeline.is_active():
+            pipeline.send({
+                "type": "error",
+                "error": "cannot_open_stream", "url": url,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        return
 
-    threadsafe_send(loop, websocket, {
-        "stream_id": stream_id, "type": "status",
-        "status": "started", "message": f"Stream {stream_id} started",
-        "timestamp": datetime.utcnow().isoformat()
-    })
-
-    min_interval = 1.0 / max_fps
-    last_ts = 0.0
-
-    while stream_id in active_streams:
-        ok, frame = cap.read()
-        if not ok:
-            break
+    faces_seen = stream_cache(stream_key)
+    reader = None
+    try:
+        realtime = options.get("realtime", os.path.isfile(url))
+        reader = pipeline.reader = FrameReader(cap, name=f"capture-{stream_key}", size=detection.capture_size,
+                                                  realtime=realtime).start()
+        pipeline.mark_started()
+        tracker = FaceTracker()
+        last_analysis = None
+        pipeline.gate, pipeline.rate, pipeline.detection = gate, rate, detection
+        last_ts = 0.0
+        last_status = time.time()
+        analyzed_at_status = 0
 
-        frame = cv2.resize(frame, (640, 480))
-        now = time.time()
-        if now - last_ts < min_interval:
-            if url == "webcam":
-                cv2.imshow(f"Live Feed {stream_id}", frame)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+        while pipeline.is_active():
+            if url != "webcam":
+                # Nothing to show: wait until due, the reader only grabs (no decode) meanwhile
+                wait = rate.interval - (time.time() - last_ts)
+                if wait > 0 and pipeline.wait(wait):
                     break
-            continue
-        last_ts = now
+            ok, frame = reader.read()
+            if not ok:
+                if not live or not pipeline.is_active():
+                    break
+                # Network source dropped or stalled: reopen it with backoff, keeping tracks and caches
+                reader.release()
+                metrics.ERRORS.inc(where="capture", error="source_dropped")
+                cap = _connect(pipeline, url, detection.capture_size, live, retry=True)
+                if cap is None:
+                    break
+                reader = pipeline.reader = FrameReader(cap, name=f"capture-{stream_key}",
+                                                          size=detection.capture_size).start()
+                gate.reset()
+                continue
+
+            now = time.time()
+            if now - last_status >= config.STREAM_STATUS_INTERVAL:
+                pipeline.fps_achieved = (pipeline.analyzed - analyzed_at_status) / (now - last_status)
+                last_status, analyzed_at_status = now, pipeline.analyzed
+                pipeline.send({
+                    "type": "status", "status": "running", "dropped_frames": reader.dropped, "gate": gate.stats(),
+                    **rate.stats(), "fps_achieved": round(pipeline.fps_achieved, 2), "errors": pipeline.errors,
+                    "timestamp": datetime.utcnow().isoformat()
+                })
+            if now - last_ts < rate.interval:
+                if url == "webcam":
+                    cv2.imshow(f"Live Feed {stream_key}", frame)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                continue
+            last_ts = now
 
-        try:
-            result = DeepFace.analyze(frame, actions=["age", "gender", "emotion"],
-                                      enforce_detection=False, detector_backend="mtcnn")
-            parsed = parse_df_result(result)
-            if parsed:
-                age, gender, emotion, region = parsed
-                embedding = DeepFace.represent(frame, model_name="Facenet", enforce_detection=False)
-                if isinstance(embedding, list):
-                    embedding = embedding[0]["embedding"]
-                else:
-                    embedding = embedding["embedding"]
+            t0 = time.perf_counter()
+            moving = gate.should_analyze(frame)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="gate")
+            if not moving:
+                # Scene unchanged since the last analysed frame: skip inference
+                metrics.FRAMES.inc(stream=stream_key, outcome="static")
+                if on_static == "resend" and last_analysis:
+                    pipeline.send(dict(last_analysis, reused=True,
+                                       timestamp=datetime.utcnow().isoformat()))
+                continue
 
-                face_id = get_face_id(embedding, stream_id)
+            try:
+                params = detection.params(frame)
+                hints = attribute_cache.hints(faces_seen, now)
+                if hints is not None:
+                    params = dict(params, known=hints)  # skip attributes cached for faces seen here
+                fut = scheduler.submit(stream_key, frame, params=params)
+                if fut is None:
+                    gate.reset()
+                    rate.observe(None)
+                    metrics.FRAMES.inc(stream=stream_key, outcome="rejected")
+                    continue    # inference backlog full, drop this frame
+                t0 = time.perf_counter()
+                faces = fut.result()
+                metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="inference")
+                rate.observe(time.time() - now)
+                pipeline.analyzed += 1
+                metrics.FRAMES.inc(stream=stream_key, outcome="analyzed")
+                last_analysis = None
+                if faces:
+                    t0 = time.perf_counter()
+                    tracker.update(faces, lambda face: get_face_id(face["embedding"], stream_key,
+                                                                    cache=faces_seen))
+                    for face in faces:
+                        attribute_cache.update(face, now)
+                    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="identify")
 
-                threadsafe_send(loop, websocket, {
-                    "stream_id": stream_id, "type": "analysis",
-                    "results": {
-                        "face_id": face_id,
-                        "age": int(age) if age else None,
-                        "gender": gender,
-                        "emotion": emotion,
+                    last_analysis = {
+                        "type": "analysis",
+                        "results": [{
+                            "face_id": face["face_id"],
+                            "age": int(face["age"]) if face["age"] else None,
+                            "gender": face["gender"],
+                            "emotion": face["emotion"],
+                            "region": face["region"],
+                        } for face in faces],
+                        "frame_timestamp": datetime.utcfromtimestamp(reader.frame_time).isoformat(),
                         "timestamp": datetime.utcnow().isoformat()
                     }
-                })
+                    if detection.two_stage:
+                        # Regions are in source pixels, not the usual 640x480 analysis frame
+                        last_analysis["frame_size"] = [frame.shape[1], frame.shape[0]]
+                    pipeline.send(last_analysis)
 
-                if url == "webcam" and region:
-                    x, y, w, h = region["x"], region["y"], region["w"], region["h"]
-                    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                    label = f"{face_id} | {age} | {gender} | {emotion}"
-                    cv2.putText(frame, label, (x, y+h+20),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+                    if url == "webcam":
+                        for face in faces:
+                            r = face["region"]
+                            x, y, w, h = r["x"], r["y"], r["w"], r["h"]
+                            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+                            label = f"{face['face_id']} | {face['age']} | {face['gender']} | {face['emotion']}"
+                            cv2.putText(frame, label, (x, y+h+20),
+                                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
-            if url == "webcam":
-                cv2.imshow(f"Live Feed {stream_id}", frame)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
+                if url == "webcam":
+                    cv2.imshow(f"Live Feed {stream_key}", frame)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
 
-        except Exception:
-            pass
+            except Exception as e:
+                # Keep the stream alive, but never silently: count it per stream and per error type
+                pipeline.errors += 1
+                metrics.FRAMES.inc(stream=stream_key, outcome="error")
+                metrics.ERRORS.inc(where="analyze_stream", error=type(e).__name__)
 
-    cap.release()
-    if url == "webcam":
-        cv2.destroyAllWindows()
+    finally:
+        # Runs however the loop ends, so no decoder, cache or window outlives the stream
+        if reader is not None:
+            reader.release()
+            if not reader.join(config.STREAM_JOIN_TIMEOUT):
+                metrics.ERRORS.inc(where="capture", error="reader_stuck")
+        drop_stream(stream_key, faces_seen)
+        if url == "webcam":
+            cv2.destroyAllWindows()
 
-    threadsafe_send(loop, websocket, {
-        "stream_id": stream_id, "type": "status",
-        "status": "stopped", "message": f"Stream {stream_id} stopped",
+    pipeline.send({
+        "type": "status", "status": "stopped", "message": "Stream stopped",
+        "dropped_frames": reader.dropped, "gate": gate.stats(), **rate.stats(), "errors": pipeline.errors,
         "timestamp": datetime.utcnow().isoformat()
     })
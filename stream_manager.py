@@ -0,0 +1,294 @@
+import json
+import time
+import zlib
+import threading
+from datetime import datetime
+import config
+import metrics
+from utils import redact_url
+
+# Handshake options that change what a pipeline computes; subscribers share a pipeline only if they agree
+PIPELINE_OPTIONS = ("roi", "min_face", "detect_scale", "two_stage", "min_fps", "max_fps", "priority",
+                    "motion_threshold", "motion_pixel_delta", "motion_max_skip", "on_static", "realtime")
+
+
+def _normalize(value):
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def pipeline_key(url, options):
+    """The URL alone with default options, else the URL plus a short hash of the pipeline options."""
+    chosen = {k: _normalize(options[k]) for k in PIPELINE_OPTIONS if options.get(k) is not None}
+    if not chosen:
+        return url
+    return f"{url}#{zlib.crc32(json.dumps(chosen, sort_keys=True, default=str).encode()):08x}"
+
+
+class Pipeline:
+    """One capture + inference pipeline for a source URL and its options, shared by every subscriber.
+
+    Subscribers are (connection, stream_id) pairs: each client keeps its own
+    stream id, and broadcast() stamps it onto the payload for that client.
+    All of them asked for the same PIPELINE_OPTIONS. `key` identifies the
+    pipeline in the registry, scheduler, metrics and thread names and, like
+    `public_url`, carries no credentials from the URL; `slot` is the
+    manager's own (secret-bearing) key.
+    """
+
+    def __init__(self, url, options, manager, key=None, slot=None):
+        self.key = key or redact_url(url)
+        self.slot = slot or url
+        self.url = url
+        self.public_url = redact_url(url)
+        self.options = options
+        self.reader = None
+        self.gate = None
+        self.rate = None
+        self.detection = None
+        self.started = False
+        self.analyzed = 0
+        self.errors = 0
+        self.fps_achieved = 0.0
+        self.stopped_at = None
+        self._manager = manager
+        self._subscribers = []          # [(conn, stream_id)]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"pipeline-{self.key}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        from stream_analyzer import analyze_stream   # pulls in cv2, only needed once a stream runs
+        try:
+            analyze_stream(self)
+        finally:
+            self._manager._finished(self)
+
+    def is_active(self):
+        return not self._stop.is_set()
+
+    def stop(self):
+        """Ask the pipeline to wind down; the reader releases the decoder on its own thread."""
+        if self.stopped_at is None:
+            self.stopped_at = time.monotonic()
+        self._stop.set()
+        if self.reader is not None:
+            self.reader.release()
+
+    def wait(self, seconds):
+        """Sleep up to `seconds`, returning True early if the pipeline is stopped meanwhile."""
+        return self._stop.wait(seconds)
+
+    def alive(self):
+        return self._thread.is_alive()
+
+    def join(self, timeout=None):
+        """Wait for the pipeline thread to exit; returns whether it did."""
+        if self._thread.ident is not None:
+            self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def add(self, conn, stream_id):
+        with self._lock:
+            self._subscribers.append((conn, stream_id))
+            if self.started:
+                _deliver(conn, _status(stream_id, "started", f"Stream {stream_id} started"))
+
+    def remove(self, conn, stream_id):
+        with self._lock:
+            self._subscribers.remove((conn, stream_id))
+            return len(self._subscribers)
+
+    def subscribers(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def send(self, payload):
+        """Broadcast one payload to every subscriber under its own stream id."""
+        for conn, stream_id in self.subscribers():
+            _deliver(conn, {"stream_id": stream_id, **payload})
+
+    def mark_started(self):
+        with self._lock:
+            self.started = True
+            for conn, stream_id in self._subscribers:
+                _deliver(conn, _status(stream_id, "started", f"Stream {stream_id} started"))
+
+    def stats(self):
+        """Live counters for /streams, /metrics and websocket `stats` messages."""
+        out = {"url": self.public_url, "key": self.key, "subscribers": len(self.subscribers()), "started": self.started,
+               "analyzed": self.analyzed, "errors": self.errors,
+               "fps_achieved": round(self.fps_achieved, 2)}
+        if self.reader is not None:
+            out.update(self.reader.stats())
+        if self.rate is not None:
+            out.update(self.rate.stats())
+        if self.gate is not None:
+            out["gate"] = self.gate.stats()
+        if self.detection is not None:
+            out["detection"] = self.detection.stats()
+        return out
+
+
+def _deliver(conn, payload):
+    """Send to one subscriber; a broken connection must not take the shared pipeline down."""
+    try:
+        conn.send(payload)
+    except Exception as e:
+        conn.send_errors = getattr(conn, "send_errors", 0) + 1
+        metrics.ERRORS.inc(where="pipeline_send", error=type(e).__name__)
+
+
+def _status(stream_id, status, message):
+    return {
+        "stream_id": stream_id, "type": "status", "status": status, "message": message,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+class StreamManager:
+    """Reference-counts subscriptions; one pipeline per source URL and set of pipeline options.
+
+    The first subscriber to a URL with given options (roi, detection, rate and
+    gate settings) starts its pipeline and later ones asking for the same
+    attach to it; different options open the source again in a pipeline of
+    their own. A pipeline is torn down when its last subscriber leaves (or the
+    source ends on its own). Stopped pipelines are watched by a supervisor
+    thread until their thread exits; one that takes longer than
+    STREAM_JOIN_TIMEOUT is reported as stuck.
+    """
+
+    def __init__(self):
+        self._pipelines = {}    # pipeline_key(url, options), the pipeline's slot -> Pipeline
+        self._subs = {}         # (conn, stream_id) -> Pipeline
+        self._stopping = []     # stopped pipelines whose thread hasn't exited yet
+        self._stuck = set()
+        self._lock = threading.Lock()
+        self._supervisor = None
+
+    def subscribe(self, conn, stream_id, url, options=None):
+        """Attach (conn, stream_id) to the pipeline for url, replacing any previous subscription."""
+        options = options or {}
+        slot = pipeline_key(url, options)
+        self.unsubscribe(conn, stream_id, notify=False)
+        with self._lock:
+            pipeline = self._pipelines.get(slot)
+            fresh = pipeline is None or not pipeline.is_active()
+            if fresh:
+                pipeline = self._pipelines[slot] = Pipeline(url, options, self, self._public_key(url, options, slot),
+                                                            slot)
+            pipeline.add(conn, stream_id)
+            self._subs[(conn, stream_id)] = pipeline
+        if fresh:
+            pipeline.start()
+        return pipeline
+
+    def _public_key(self, url, options, slot):
+        """pipeline_key without credentials, made unique if only the credentials differ."""
+        key = base = pipeline_key(redact_url(url), options)
+        taken = {p.key for p in (*self._pipelines.values(), *self._stopping) if p.slot != slot}
+        n = 1
+        while key in taken:
+            n += 1
+            key = f"{base}~{n}"
+        return key
+
+    def unsubscribe(self, conn, stream_id, notify=True):
+        with self._lock:
+            pipeline = self._subs.pop((conn, stream_id), None)
+            if pipeline is None:
+                return False
+            if pipeline.remove(conn, stream_id) == 0:
+                self._retire(pipeline)
+        if notify:
+            conn.send(_status(stream_id, "stopped", f"Stream {stream_id} stopped"))
+        return True
+
+    def unsubscribe_all(self, conn, notify=True):
+        with self._lock:
+            mine = [sid for (c, sid) in self._subs if c is conn]
+        for sid in mine:
+            self.unsubscribe(conn, sid, notify)
+        return mine
+
+    def _retire(self, pipeline):
+        """Stop a pipeline and hand it to the supervisor (called with the lock held)."""
+        pipeline.stop()
+        if self._pipelines.get(pipeline.slot) is pipeline:
+            del self._pipelines[pipeline.slot]
+        if pipeline.alive():
+            self._stopping.append(pipeline)
+            if self._supervisor is None:
+                self._supervisor = threading.Thread(target=self._supervise, name="stream-supervisor",
+                                                    daemon=True)
+                self._supervisor.start()
+
+    def _supervise(self):
+        """Reap stopped pipelines; exits once none are left and is restarted on demand."""
+        while True:
+            time.sleep(0.5)
+            with self._lock:
+                now = time.monotonic()
+                for p in self._stopping:
+                    if not p.alive():
+                        self._stuck.discard(p)
+                    elif p not in self._stuck and now - p.stopped_at > config.STREAM_JOIN_TIMEOUT:
+                        # Blocked in the decoder or a model call; it is daemonic and finishes on its own
+                        self._stuck.add(p)
+                        metrics.ERRORS.inc(where="stream_supervisor", error="pipeline_stuck")
+                self._stopping = [p for p in self._stopping if p.alive()]
+                if not self._stopping:
+                    self._supervisor = None
+                    return
+
+    def shutdown(self, timeout=None):
+        """Stop every pipeline and wait for their threads; returns the number still running."""
+        timeout = config.STREAM_JOIN_TIMEOUT if timeout is None else timeout
+        with self._lock:
+            for pipeline in list(self._pipelines.values()):
+                self._retire(pipeline)
+            self._subs.clear()
+            pending = list(self._stopping)
+        deadline = time.monotonic() + timeout
+        return sum(not p.join(max(0.0, deadline - time.monotonic())) for p in pending)
+
+    def _finished(self, pipeline):
+        """Called from the pipeline thread once analyze_stream has returned."""
+        pipeline.stop()
+        with self._lock:
+            if self._pipelines.get(pipeline.slot) is pipeline:
+                del self._pipelines[pipeline.slot]
+            for sub in pipeline.subscribers():
+                if self._subs.get(sub) is pipeline:
+                    del self._subs[sub]
+
+    def pipelines(self):
+        with self._lock:
+            return list(self._pipelines.values())
+
+    def threads(self):
+        """Pipeline threads by state: running, stopping (winding down) and stuck."""
+        with self._lock:
+            stopping = [p for p in self._stopping if p.alive()]
+            return {"running": sum(p.alive() for p in self._pipelines.values()),
+                    "stopping": sum(p not in self._stuck for p in stopping),
+                    "stuck": sum(p in self._stuck for p in stopping)}
+
+    def stats(self, conn=None):
+        """Stats of every pipeline, or with conn, of that connection's streams keyed by its stream ids."""
+        if conn is None:
+            return [p.stats() for p in self.pipelines()]
+        with self._lock:
+            mine = [(sid, p) for (c, sid), p in self._subs.items() if c is conn]
+        return [{"stream_id": sid, **p.stats()} for sid, p in mine]
+
+
+manager = StreamManager()
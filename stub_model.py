@@ -0,0 +1,60 @@
+"""Deterministic stand-in for DeepFace (INFERENCE_BACKEND=stub), for benchmarks.
+
+Has the three DeepFace calls inference.py makes. A "face" is any solid,
+near-saturated blob of at least MIN_AREA pixels, which is what
+benchmarks/e2e.py draws into its synthetic videos; a face's attributes and
+embedding depend only on its colour, so the same blob gets the same
+identity in every frame and every run. Costs a few milliseconds of OpenCV
+per frame, plus STUB_MODEL_MS of simulated model time (a sleep, so it
+releases the GIL like the real models' native code).
+"""
+import time
+import zlib
+import cv2
+import numpy as np
+import config
+
+MIN_AREA = 400
+DIM = 128
+GENDERS = ("Man", "Woman")
+EMOTIONS = ("neutral", "happy", "sad", "surprise", "angry", "fear", "disgust")
+
+
+def _colour(img):
+    """Mean colour of a crop's centre, quantised so compression noise and resize blur don't change it."""
+    h, w = img.shape[:2]
+    centre = img[h // 4: h - h // 4, w // 4: w - w // 4]
+    return tuple(int(round(c / 64)) for c in centre.reshape(-1, 3).mean(axis=0))
+
+
+def extract_faces(img, detector_backend=None, enforce_detection=False, align=False, **_):
+    if config.STUB_MODEL_MS:
+        time.sleep(config.STUB_MODEL_MS / 1000)
+    mask = (img.max(axis=2) >= 230).astype(np.uint8)
+    n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=4)
+    faces = []
+    for x, y, w, h, area in stats[1:n]:
+        if area >= MIN_AREA:
+            faces.append({"face": img[y:y+h, x:x+w],
+                          "facial_area": {"x": int(x), "y": int(y), "w": int(w), "h": int(h)},
+                          "confidence": 1.0})
+    return faces
+
+
+def analyze(img, actions=None, enforce_detection=False, detector_backend=None, **_):
+    b, g, r = _colour(img)
+    actions = actions or ("age", "gender", "emotion")
+    out = {"region": {"x": 0, "y": 0, "w": img.shape[1], "h": img.shape[0]}}
+    if "age" in actions:
+        out["age"] = 18 + (3 * r + 5 * g + 7 * b) % 50
+    if "gender" in actions:
+        out["dominant_gender"] = GENDERS[(r + b) % 2]
+    if "emotion" in actions:
+        out["dominant_emotion"] = EMOTIONS[(r + g + b) % len(EMOTIONS)]
+    return [out]
+
+
+def represent(img, model_name=None, enforce_detection=False, detector_backend=None, **_):
+    seed = zlib.crc32(bytes(_colour(img)))
+    v = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return [{"embedding": (v / np.linalg.norm(v)).tolist()}]
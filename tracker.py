@@ -0,0 +1,69 @@
+import time
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU between (n, 4) and (m, 4) arrays of x, y, w, h boxes."""
+    ax1, ay1, ax2, ay2 = a[:, 0:1], a[:, 1:2], a[:, 0:1] + a[:, 2:3], a[:, 1:2] + a[:, 3:4]
+    bx1, by1, bx2, by2 = b[:, 0], b[:, 1], b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    iw = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    ih = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    inter = iw * ih
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+class FaceTracker:
+    """Per-stream IoU/centroid tracker: faces that persist between frames keep their face_id."""
+
+    def __init__(self, iou_threshold=0.3, centroid_ratio=0.5, max_age=2.0):
+        self.iou_threshold = iou_threshold
+        self.centroid_ratio = centroid_ratio   # max centre shift, as a fraction of the track's box size
+        self.max_age = max_age                 # seconds a track survives without a detection
+        self.tracks = []                       # [{"face_id", "box", "last_seen"}]
+        self.hits = 0
+        self.misses = 0
+
+    def _match(self, boxes):
+        """Greedy assignment: best IoU first, then nearest centre for fast movers."""
+        if not self.tracks or not len(boxes):
+            return {}
+        tboxes = np.array([t["box"] for t in self.tracks], dtype=np.float32)
+        iou = iou_matrix(tboxes, boxes)
+        tc = tboxes[:, :2] + tboxes[:, 2:] / 2
+        bc = boxes[:, :2] + boxes[:, 2:] / 2
+        dist = np.linalg.norm(tc[:, None, :] - bc[None, :, :], axis=2)
+        reach = self.centroid_ratio * tboxes[:, 2:].max(axis=1, keepdims=True)
+
+        matches, used_t, used_b = {}, set(), set()
+        for score, ok in ((iou, iou >= self.iou_threshold), (-dist, dist <= reach)):
+            for flat in np.argsort(-score, axis=None):
+                ti, bi = divmod(int(flat), score.shape[1])
+                if not ok[ti, bi]:
+                    continue
+                if ti in used_t or bi in used_b:
+                    continue
+                matches[bi] = ti
+                used_t.add(ti)
+                used_b.add(bi)
+        return matches
+
+    def update(self, faces, resolve):
+        """Assign face["face_id"] for every face; resolve(face) is called only for new tracks."""
+        now = time.time()
+        self.tracks = [t for t in self.tracks if now - t["last_seen"] < self.max_age]
+        boxes = np.array([[f["region"][k] for k in ("x", "y", "w", "h")] for f in faces],
+                         dtype=np.float32).reshape(-1, 4)
+        matches = self._match(boxes)
+        for bi, face in enumerate(faces):
+            if bi in matches:
+                track = self.tracks[matches[bi]]
+                self.hits += 1
+            else:
+                track = {"face_id": resolve(face)}
+                self.tracks.append(track)
+                self.misses += 1
+            track["box"] = boxes[bi].tolist()
+            track["last_seen"] = now
+            face["face_id"] = track["face_id"]
+        return faces
@@ -1,20 +1,31 @@
-import asyncio
+from urllib.parse import urlsplit, urlunsplit
 
-def threadsafe_send(loop, websocket, payload: dict):
-    """Send JSON safely from worker thread to WS loop."""
-    fut = asyncio.run_coroutine_threadsafe(websocket.send_json(payload), loop)
+
+def redact_url(url):
+    """url without user:password@, safe to show on /streams, /metrics and in thread names."""
     try:
-        fut.result()
-    except Exception:
-        pass
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    if "@" not in parts.netloc:
+        return url
+    return urlunsplit(parts._replace(netloc=parts.netloc.rpartition("@")[2]))
 
-def parse_df_result(res):
-    """Normalize DeepFace result → (age, gender, emotion, region)."""
+def parse_df_results(res):
+    """Normalize DeepFace result → [(age, gender, emotion, region)], one per detected face."""
     if res is None:
-        return None
-    item = res[0] if isinstance(res, list) else res
-    age = item.get("age")
-    gender = item.get("dominant_gender") or item.get("gender")
-    emotion = item.get("dominant_emotion") or (item.get("emotion") or {}).get("dominant")
-    region = item.get("region")
-    return age, gender, emotion, region
+        return []
+    items = res if isinstance(res, list) else [res]
+    out = []
+    for item in items:
+        age = item.get("age")
+        gender = item.get("dominant_gender") or item.get("gender")
+        emotion = item.get("dominant_emotion") or (item.get("emotion") or {}).get("dominant")
+        region = item.get("region")
+        out.append((age, gender, emotion, region))
+    return out
+
+def parse_df_result(res):
+    """Normalize DeepFace result → (age, gender, emotion, region) of the first face."""
+    parsed = parse_df_results(res)
+    return parsed[0] if parsed else None
@@ -0,0 +1,136 @@
+"""Wire formats for /ws/deepface results.
+
+"json" (default) is the original one-JSON-message-per-result protocol.
+"msgpack" is negotiated in the `streams` handshake and sends coalesced binary
+frames:
+
+    [VERSION, interns, messages]
+
+`interns` is a list of [index, string] pairs first used in this frame; the
+table is per connection and grows monotonically (index 0 means None).
+Stream ids, face ids, genders and emotions are sent as interned indexes.
+Each message is either
+
+    [MSG_ANALYSIS, stream, ts_ms, reused, faces, extra]
+        faces: [[face_id, age (-1 = unknown), gender, emotion, x, y, w, h(, extra)]...]
+    [MSG_OTHER, stream, ts_ms, payload]      # status/error, remaining keys as a map
+
+with timestamps as integer epoch milliseconds, both `timestamp` and the
+_TIME_KEYS fields carried in `extra` (e.g. frame_timestamp).
+"""
+from datetime import datetime, timezone
+
+try:
+    import msgpack
+except ImportError:     # optional: only needed when a client negotiates "msgpack"
+    msgpack = None
+
+VERSION = 1
+MSG_ANALYSIS = 0
+MSG_OTHER = 1
+FORMATS = ("json", "msgpack")
+
+_FACE_KEYS = ("face_id", "age", "gender", "emotion", "region")
+_ANALYSIS_KEYS = ("stream_id", "type", "results", "timestamp", "reused")
+_TIME_KEYS = ("frame_timestamp",)
+
+
+def epoch_ms(ts):
+    """ISO-8601 (naive = UTC) or epoch seconds → integer epoch milliseconds."""
+    if ts is None:
+        return 0
+    if isinstance(ts, str):
+        dt = datetime.fromisoformat(ts)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp() * 1000)
+    return int(ts * 1000)
+
+
+def available(fmt):
+    return fmt == "json" or (fmt == "msgpack" and msgpack is not None)
+
+
+class MsgpackEncoder:
+    """Per-connection encoder; owns the interning table, so use one per socket."""
+
+    def __init__(self):
+        self._table = {}
+        self._pending = []
+
+    def _ref(self, value):
+        if value is None:
+            return 0
+        value = str(value)
+        ref = self._table.get(value)
+        if ref is None:
+            ref = self._table[value] = len(self._table) + 1
+            self._pending.append([ref, value])
+        return ref
+
+    def _face(self, face):
+        r = face.get("region") or {}
+        out = [self._ref(face.get("face_id")),
+               -1 if face.get("age") is None else int(face["age"]),
+               self._ref(face.get("gender")), self._ref(face.get("emotion")),
+               r.get("x", 0), r.get("y", 0), r.get("w", 0), r.get("h", 0)]
+        extra = {k: v for k, v in face.items() if k not in _FACE_KEYS}
+        if extra:
+            out.append(extra)
+        return out
+
+    def _message(self, payload):
+        sref = self._ref(payload.get("stream_id"))
+        ts = epoch_ms(payload.get("timestamp"))
+        if payload.get("type") == "analysis":
+            extra = {k: epoch_ms(v) if k in _TIME_KEYS else v
+                     for k, v in payload.items() if k not in _ANALYSIS_KEYS}
+            return [MSG_ANALYSIS, sref, ts, bool(payload.get("reused")),
+                    [self._face(f) for f in payload.get("results", [])], extra]
+        rest = {k: v for k, v in payload.items() if k not in ("stream_id", "timestamp")}
+        return [MSG_OTHER, sref, ts, rest]
+
+    def encode(self, payloads):
+        """Coalesce a list of result payloads into one binary frame."""
+        messages = [self._message(p) for p in payloads]
+        interns, self._pending = self._pending, []
+        return msgpack.packb([VERSION, interns, messages], use_bin_type=True)
+
+
+class MsgpackDecoder:
+    """Client-side counterpart of MsgpackEncoder; yields the original payload dicts."""
+
+    def __init__(self):
+        self._table = {0: None}
+
+    def decode(self, data):
+        # strict_map_key=False: status and stats payloads may carry int-keyed maps
+        version, interns, messages = msgpack.unpackb(data, raw=False, strict_map_key=False)
+        if version != VERSION:
+            raise ValueError(f"unsupported wire version {version}")
+        for ref, value in interns:
+            self._table[ref] = value
+        t = self._table
+        out = []
+        for msg in messages:
+            kind, sref, ts = msg[0], msg[1], msg[2]
+            if kind == MSG_ANALYSIS:
+                _, _, _, reused, faces, extra = msg
+                results = []
+                for f in faces:
+                    face = {"face_id": t[f[0]], "age": None if f[1] < 0 else f[1],
+                            "gender": t[f[2]], "emotion": t[f[3]],
+                            "region": {"x": f[4], "y": f[5], "w": f[6], "h": f[7]}}
+                    if len(f) > 8:
+                        face.update(f[8])
+                    results.append(face)
+                payload = {"stream_id": t[sref], "type": "analysis", "results": results,
+                           "timestamp": ts, **extra}
+                if reused:
+                    payload["reused"] = True
+            else:
+                payload = {"stream_id": t[sref], "timestamp": ts, **msg[3]}
+                if payload["stream_id"] is None:
+                    del payload["stream_id"]
+            out.append(payload)
+        return out
@@ -1,20 +1,59 @@
-import json, asyncio, threading
+import json, asyncio
+from datetime import datetime
 from fastapi import WebSocket, WebSocketDisconnect
-from stream_analyzer import analyze_stream, active_streams, video_caps
+from stream_manager import manager
+from connection import Connection
+from scheduler import get_scheduler
+
+MIN_STATS_INTERVAL = 0.5
+
+
+async def _push_stats(conn, interval):
+    """Send this connection's own counters every `interval` seconds (handshake "stats")."""
+    while True:
+        await asyncio.sleep(interval)
+        conn.send({
+            "type": "stats", "connection": conn.stats(), "streams": manager.stats(conn),
+            "scheduler": get_scheduler().stats(), "timestamp": datetime.utcnow().isoformat()
+        })
+
+def _stats_interval(value):
+    """Seconds between `stats` pushes from the handshake; None when not asked for."""
+    if value is None or value is False:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < MIN_STATS_INTERVAL:
+        raise ValueError(f"stats must be a number of seconds >= {MIN_STATS_INTERVAL}, got {value!r}")
+    return float(value)
 
 def register_ws_routes(app):
     @app.websocket("/ws/deepface")
     async def ws_deepface(websocket: WebSocket):
         await websocket.accept()
         loop = asyncio.get_running_loop()
+        conn = None
+        stats_task = None
         try:
             data = await websocket.receive_json()
+            try:
+                stats_interval = _stats_interval(data.get("stats"))
+                conn = Connection.negotiate(websocket, loop, data)
+            except ValueError as e:
+                await websocket.send_json({
+                    "type": "error", "error": "invalid_options", "message": str(e),
+                    "timestamp": datetime.utcnow().isoformat()
+                })
+                await websocket.close(code=1008)
+                return
+            conn.start()
+            await websocket.send_json({
+                "type": "status", "status": "connected",
+                "format": conn.format, "flush_ms": conn.flush_interval * 1000
+            })
+            if stats_interval:
+                stats_task = asyncio.create_task(_push_stats(conn, stats_interval))
             streams = data.get("streams", [])
             for st in streams:
-                sid, url = st["id"], st["url"]
-                t = threading.Thread(target=analyze_stream, args=(sid, url, websocket, loop), daemon=True)
-                active_streams[sid] = t
-                t.start()
+                manager.subscribe(conn, st["id"], st["url"], st)
 
             while True:
                 msg = await websocket.receive_text()
@@ -24,20 +63,11 @@ def register_ws_routes(app):
                     continue
 
                 if "stop" in cmd:
-                    sid = cmd["stop"]
-                    if sid in active_streams:
-                        del active_streams[sid]
-                        if sid in video_caps:
-                            video_caps[sid].release()
-                            video_caps.pop(sid, None)
+                    manager.unsubscribe(conn, cmd["stop"])
 
                 if cmd.get("stop_all"):
-                    for sid in list(active_streams.keys()):
-                        del active_streams[sid]
-                        if sid in video_caps:
-                            video_caps[sid].release()
-                            video_caps.pop(sid, None)
-                    await websocket.send_json({
+                    manager.unsubscribe_all(conn)
+                    conn.send({
                         "type": "status", "status": "all_stopped",
                         "message": "All streams stopped"
                     })
@@ -46,17 +76,10 @@ def register_ws_routes(app):
                     switch_data = cmd["switch"]
                     sid, new_url = switch_data["id"], switch_data["url"]
 
-                    if sid in active_streams:
-                        del active_streams[sid]
-                    if sid in video_caps:
-                        video_caps[sid].release()
-                        video_caps.pop(sid, None)
-
-                    t = threading.Thread(target=analyze_stream, args=(sid, new_url, websocket, loop), daemon=True)
-                    active_streams[sid] = t
-                    t.start()
+                    manager.unsubscribe(conn, sid)
+                    manager.subscribe(conn, sid, new_url, switch_data)
 
-                    await websocket.send_json({
+                    conn.send({
                         "stream_id": sid,
                         "type": "status",
                         "status": "switched",
@@ -64,8 +87,11 @@ def register_ws_routes(app):
                     })
 
         except WebSocketDisconnect:
-            for sid in list(active_streams.keys()):
-                del active_streams[sid]
-                if sid in video_caps:
-                    video_caps[sid].release()
-                    video_caps.pop(sid, None)
+            pass
+        finally:
+            # Any exit (disconnect, bad message, server shutdown) releases this client's pipelines
+            if stats_task is not None:
+                stats_task.cancel()
+            if conn is not None:
+                manager.unsubscribe_all(conn, notify=False)
+                await conn.close()